@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg") #Figures are only saved to files, so no display is needed.
+import matplotlib.pyplot as plt
+
+from equation import rpnTurnIntoList,rpnGetVariables,rpnCheckValidExpression
+from controls import createControlVariables,applyControlVariables
+from settings import getSetting
+from columnAlignment import alignmentModes
+from columnStore import ColumnStore,ColumnRecord
+from evFileCache import getCachedColumnLocation,loadCachedColumn
+import outOfCore
+import phantomEvFilePlotter
+
+
+#Plots are described by a JSON specification file instead of being chosen through prompts, so many figures can be saved without a display.
+#Relative paths in the specification are relative to the directory of the specification file. An example specification is:
+#{
+# "files":["run1/*.ev","sweep_{1..3}/drag.ev"],
+# "columns":[{"operation":"e","name":"Total torque","expression":"3a 4a +"},
+#            {"operation":"i","name":["Integrated torque","Integrated drag"],"y":["1_","5a"],"x":"1a","constant":0.0},
+#            {"operation":"d","name":"Drag derivative","y":"5a","x":"1a","radius":2},
+#            {"operation":"l","name":"Linear","count":100,"start":0.0,"end":1.0},
+#            {"operation":"p","name":"Drag fit","x":"1a","y":"5a","order":3}],
+# "figures":[{"output":"torque.pdf","curves":[["1a","1_","Total torque"]],"xUnit":1,"yUnit":["torque","code units",1.0],
+#             "controls":{"fontSize":14,"yAxisUseScientificNotation":false}}]
+#}
+#The figures are rendered at the same time by the number of processes given by an optional "workers" entry (by default the
+#PHANTOM_EV_WORKERS setting).
+#Only the columns used by the user created columns and figures are loaded from the files if there is a "selectiveLoading" entry set to
+#true, and the columns are stored as 32 bit floats if there is a "float32" entry set to true (by default the PHANTOM_EV_SELECTIVE_LOADING
+#and PHANTOM_EV_FLOAT32 settings).
+#An entry of "files" can also be a list of paths, in which case the files it matches are the files of a restarted run that are joined into
+#one set of columns (see evFileMerger), such as ["restarted/run_0*.ev"].
+#A polynomial fit is made separately over windows of the columns if there is a "windows" entry holding a list of [start,end] row index
+#ranges, or ranges of x values if there is also a "windowsByX" entry set to true, such as "windows":[[0.0,2.5],[2.5,6.0]].
+#A "w" column holds the rows of each of its "y" columns where its "x" column is from its "minimum" to its "maximum", such as
+#{"operation":"w","name":["Plunge time","Plunge drag"],"y":["1a","5a"],"x":"1a","minimum":100.0,"maximum":250.0}. A curve can also be
+#restricted to a range of x values (in the units of the x column) by adding the lowest and highest x values after its legend name.
+#An "e" column combines rows with the same x values instead of the same index if there is an "align" entry holding the key of a column,
+#such as a "g" column, in which case each column in the expression is interpolated onto the values of that column (see columnAlignment).
+#Columns from files are interpolated from the first column of their file, and user created columns from the column given for them in an
+#"xColumns" entry, such as {"3_":"1a"}. A "g" column holds every value of its "x" columns in order if its "mode" is "union", or the values
+#where they overlap if its "mode" is "intersection", such as {"operation":"g","name":"Common time","mode":"union","x":["1a","1b"]}.
+#A figure's curves are drawn as one collection keyed by a colour bar (see curveCollection) if it has a "curveCollection" entry set to true,
+#or if it has at least PHANTOM_EV_COLLECTION_CURVES curves and no "curveCollection" entry.
+#Files are given keys as in getColumnData and user created columns are given the keys 1_, 2_, 3_... in the order they are created.
+#Units are either the number of a unit in createUnitDictionary or a list holding an axis name, unit name and scale factor from phantom units.
+
+
+def loadPlotSpecification(specificationPath):
+    with open(specificationPath,"r") as specificationFile:
+        plotSpecification=json.load(specificationFile)
+
+    plotSpecification["directory"]=os.path.dirname(os.path.abspath(specificationPath))
+    return plotSpecification
+
+
+def getSpecificationPath(plotSpecification,specifiedPath):
+    return os.path.join(plotSpecification["directory"],specifiedPath)
+
+
+#Gets the file names in the same order as openFiles does, with restarted runs given as tuples of file names.
+def getSpecificationFileNames(plotSpecification):
+    fileNames=[]
+    for currentFilePath in plotSpecification["files"]:
+        if(isinstance(currentFilePath,list)):
+            runFileNames=[]
+            for currentRunFilePath in currentFilePath:
+                runFileNames.extend(phantomEvFilePlotter.expandFilePath(getSpecificationPath(plotSpecification,currentRunFilePath)))
+            fileNames.append(tuple(sorted(runFileNames)))
+        else:
+            fileNames.extend(phantomEvFilePlotter.expandFilePath(getSpecificationPath(plotSpecification,currentFilePath)))
+
+    fileNames.sort(key=lambda i:i if(isinstance(i,str)) else i[0]) #Sorts the filenames in Unicode code point order, with runs sorted by their first file.
+    return fileNames
+
+
+#Gives an entry of a column specification as a list, as the names and y columns of integrals and derivatives can be given either as
+#a single value or a list of values.
+def getSpecificationList(specificationEntry):
+    return specificationEntry if(isinstance(specificationEntry,list)) else [specificationEntry]
+
+
+#Creates the user created columns described in the specification, in the same way as the options in getColumnPairsToPlot. Apart from
+#polynomial fits, the columns are only computed if they are used by a figure.
+def createSpecificationColumns(columnData,columnSpecifications):
+    for currentSpecification in columnSpecifications:
+        operation=currentSpecification["operation"]
+        columnNames=getSpecificationList(currentSpecification["name"])
+
+        if(operation=="l"):
+            recipes=[("l",int(currentSpecification["count"]),float(currentSpecification["start"]),float(currentSpecification["end"]))]
+
+        elif(operation=="e"):
+            expressionList=rpnTurnIntoList(currentSpecification["expression"])
+            expressionVariables=rpnGetVariables(expressionList,list(columnData.keys()))
+            if((len(expressionVariables)==0) or (not rpnCheckValidExpression(expressionList))):
+                raise ValueError("The RPN expression \""+currentSpecification["expression"]+"\" is invalid.")
+            recipes=[("e",expressionList,expressionVariables)]
+            if("align" in currentSpecification): #The columns are interpolated onto the values of the column given by "align".
+                xColumns=currentSpecification.get("xColumns",{})
+                variableKeys=list(dict.fromkeys([i[0] for i in expressionVariables]))
+                xKeys=tuple([(i,xColumns[i] if(i in xColumns) else phantomEvFilePlotter.getDefaultXKey(columnData,i)) for i in variableKeys])
+                if(None in [i[1] for i in xKeys]):
+                    raise ValueError("The x columns of the user created columns in the RPN expression \""+currentSpecification["expression"]+"\" need to be given in \"xColumns\".")
+                recipes=[recipes[0]+(currentSpecification["align"],xKeys)]
+
+        elif(operation=="g"):
+            if(currentSpecification["mode"] not in alignmentModes):
+                raise ValueError("The grid mode \""+currentSpecification["mode"]+"\" is not one of "+", ".join(alignmentModes)+".")
+            recipes=[("g",currentSpecification["mode"])+tuple(getSpecificationList(currentSpecification["x"]))]
+
+        elif(operation in ["i","d"]): #All of the columns are integrated or differentiated at once.
+            recipeParameter=float(currentSpecification.get("constant",0.0)) if(operation=="i") else int(currentSpecification["radius"])
+            recipes=[(operation,currentSpecification["x"],i,recipeParameter) for i in getSpecificationList(currentSpecification["y"])]
+
+        elif(operation=="p"):
+            recipes=[("p",currentSpecification["x"],currentSpecification["y"],int(currentSpecification["order"]))]
+            if("windows" in currentSpecification): #The polynomial is fitted separately over each window.
+                windowsByX=bool(currentSpecification.get("windowsByX",False))
+                fitWindows=tuple([tuple([float(j) if(windowsByX) else int(j) for j in i]) for i in currentSpecification["windows"]])
+                recipes=[recipes[0]+(fitWindows,windowsByX)]
+
+        elif(operation=="w"):
+            recipes=[("w",currentSpecification["x"],i,float(currentSpecification["minimum"]),float(currentSpecification["maximum"])) for i in getSpecificationList(currentSpecification["y"])]
+
+        else:
+            raise ValueError("The column operation \""+operation+"\" is not one of l, e, i, d, p, w or g.")
+
+        for currentRecipe,currentName in zip(recipes,columnNames):
+            if(not phantomEvFilePlotter.checkRecipeLengths(columnData,currentRecipe)):
+                raise ValueError("The columns used to create the column \""+currentName+"\" have different lengths.")
+
+            if(operation=="p"):
+                fittedColumn=phantomEvFilePlotter.getDerivedColumns(columnData,[currentRecipe])[0]
+                print("Polynomial fit coefficients for "+currentName+" in order from the lowest to heighest are: "+str(numpy.array(fittedColumn[1]["coefficients"])))
+                phantomEvFilePlotter.addUserColumn(columnData,currentName,fittedColumn[0],currentRecipe,fittedColumn[2])
+            else:
+                phantomEvFilePlotter.addUserColumn(columnData,currentName,None,currentRecipe)
+
+
+def getSpecificationUnits(unitSpecification):
+    if(isinstance(unitSpecification,list)):
+        return (unitSpecification[0],unitSpecification[1],float(unitSpecification[2]))
+
+    return phantomEvFilePlotter.createUnitDictionary()[int(unitSpecification)]
+
+
+#Plots a figure described in the specification and saves it to its output file, with the format chosen by the file extension.
+def renderSpecificationFigure(plotSpecification,columnData,figureSpecification):
+    curvesToPlot=[tuple(i) for i in figureSpecification["curves"]]
+    xUnits=getSpecificationUnits(figureSpecification["xUnit"])
+    yUnits=getSpecificationUnits(figureSpecification["yUnit"])
+
+    plotFigure=phantomEvFilePlotter.plotColumnPairs(columnData,curvesToPlot,xUnits,yUnits,levelOfDetail=figureSpecification.get("levelOfDetail",False),
+                                                   curveCollection=figureSpecification.get("curveCollection"))
+    controlVariables=createControlVariables()
+    controlVariables.update(figureSpecification.get("controls",{}))
+    applyControlVariables(plotFigure,controlVariables,xUnits,yUnits)
+    plotFigure.tight_layout()
+
+    outputPath=getSpecificationPath(plotSpecification,figureSpecification["output"])
+    plotFigure.savefig(outputPath)
+    plt.close(plotFigure)
+    return outputPath
+
+
+#Copies the columns used by the figures into a single block of shared memory so processes rendering the figures can use them without
+#each receiving a copy. Columns memory mapped from the cache are not copied, as the processes can memory map them from the cache
+#themselves. Returns the shared memory and a layout associating each column key with its file name, column name, start position in the
+#shared memory (in values), length and (for columns in the cache) the cache entry path and row given by getCachedColumnLocation.
+def shareColumnData(columnData,figureSpecifications):
+    usedColumnKeys=[]
+    for currentFigureSpecification in figureSpecifications:
+        for currentCurve in currentFigureSpecification["curves"]:
+            usedColumnKeys.extend([i for i in currentCurve[0:2] if((i not in usedColumnKeys) and (i in columnData))]) #Unknown keys cause an error when the figure is rendered.
+
+    columnData.materializeColumns(usedColumnKeys)
+    columnLayout={}
+    valueCount=0
+    for currentKey in usedColumnKeys:
+        currentColumnData=columnData[currentKey]
+        cachedLocation=getCachedColumnLocation(currentColumnData["values"])
+        if(cachedLocation is not None):
+            columnLayout[currentKey]=(currentColumnData["fileName"],currentColumnData["columnName"],valueCount,0)+cachedLocation
+            continue
+        columnLayout[currentKey]=(currentColumnData["fileName"],currentColumnData["columnName"],valueCount,len(currentColumnData["values"]),None,None)
+        valueCount+=len(currentColumnData["values"])
+
+    from multiprocessing import shared_memory
+    sharedColumns=shared_memory.SharedMemory(create=True,size=max(1,8*valueCount))
+    sharedValues=numpy.ndarray((valueCount,),dtype=numpy.float64,buffer=sharedColumns.buf)
+    for currentKey,currentLayout in columnLayout.items():
+        if(currentLayout[4] is None):
+            sharedValues[currentLayout[2]:currentLayout[2]+currentLayout[3]]=columnData[currentKey]["values"]
+
+    del sharedValues #The shared memory cannot be closed while arrays still use it.
+    return sharedColumns,columnLayout
+
+
+#Renders a figure in a worker process using the columns shared by shareColumnData, memory mapping the columns that are in the cache.
+#Returns the output path and the time taken.
+def renderFigureInWorker(sharedMemoryName,columnLayout,plotSpecification,figureSpecification):
+    from multiprocessing import shared_memory
+    startTime=time.perf_counter()
+    sharedColumns=shared_memory.SharedMemory(name=sharedMemoryName)
+
+    try:
+        valueCount=sum([i[3] for i in columnLayout.values()])
+        sharedValues=numpy.ndarray((valueCount,),dtype=numpy.float64,buffer=sharedColumns.buf)
+        columnData=ColumnStore()
+        for currentKey,currentLayout in columnLayout.items():
+            if(currentLayout[4] is not None):
+                columnValues=loadCachedColumn(currentLayout[4],currentLayout[5])
+            else:
+                columnValues=sharedValues[currentLayout[2]:currentLayout[2]+currentLayout[3]]
+            columnData[currentKey]=ColumnRecord(currentLayout[0],currentLayout[1],columnValues)
+        outputPath=renderSpecificationFigure(plotSpecification,columnData,figureSpecification)
+        del columnData,sharedValues
+    finally:
+        sharedColumns.close()
+
+    return outputPath,time.perf_counter()-startTime
+
+
+#Renders all of the figures of a specification, spread across a pool of processes. Prints the time taken to render each figure and
+#the errors of figures that could not be rendered, which do not stop the other figures being rendered. Returns the number of failures.
+def renderSpecificationFigures(plotSpecification,columnData):
+    figureSpecifications=plotSpecification["figures"]
+    workerCount=max(1,min(int(plotSpecification.get("workers",getSetting("WORKERS",os.cpu_count() or 1))),len(figureSpecifications)))
+    if(outOfCore.outOfCoreEnabled): #The columns would have to be copied into shared memory for the worker processes.
+        workerCount=1
+    if(workerCount>1):
+        try:
+            from multiprocessing import shared_memory
+        except ImportError: #Shared memory needs Python 3.8 or later, so the figures are rendered one at a time on older versions.
+            workerCount=1
+    renderResults=[]
+
+    if(workerCount==1):
+        for currentFigureSpecification in figureSpecifications:
+            startTime=time.perf_counter()
+            try:
+                outputPath=renderSpecificationFigure(plotSpecification,columnData,currentFigureSpecification)
+                renderResults.append((outputPath,time.perf_counter()-startTime,None))
+            except Exception as renderError:
+                renderResults.append((getSpecificationPath(plotSpecification,currentFigureSpecification["output"]),time.perf_counter()-startTime,renderError))
+    else:
+        sharedColumns,columnLayout=shareColumnData(columnData,figureSpecifications)
+        try:
+            with ProcessPoolExecutor(max_workers=workerCount) as renderExecutor:
+                renderFutures=[renderExecutor.submit(renderFigureInWorker,sharedColumns.name,columnLayout,plotSpecification,i) for i in figureSpecifications]
+                for currentFigureSpecification,currentFuture in zip(figureSpecifications,renderFutures):
+                    try:
+                        renderResults.append((*currentFuture.result(),None))
+                    except Exception as renderError:
+                        renderResults.append((getSpecificationPath(plotSpecification,currentFigureSpecification["output"]),0.0,renderError))
+        finally:
+            sharedColumns.close()
+            sharedColumns.unlink()
+
+    print("Figure rendering times:")
+    failureCount=0
+    for outputPath,renderTime,renderError in renderResults:
+        if(renderError is None):
+            print(" {:8.3f} s  {}".format(renderTime,outputPath))
+        else:
+            print(" failed      {}: {}".format(outputPath,renderError))
+            failureCount+=1
+
+    print(str(len(renderResults)-failureCount)+" figures saved, "+str(failureCount)+" failed.")
+    return failureCount
+
+
+def runPlotSpecification(specificationPath):
+    plotSpecification=loadPlotSpecification(specificationPath)
+    fileNames=getSpecificationFileNames(plotSpecification)
+    selectiveLoading=bool(plotSpecification.get("selectiveLoading",getSetting("SELECTIVE_LOADING",False)))
+    float32Values=bool(plotSpecification.get("float32",getSetting("FLOAT32",False)))
+    columnData=phantomEvFilePlotter.getColumnData(fileNames,selectiveLoading=selectiveLoading,float32Values=float32Values)
+    createSpecificationColumns(columnData,plotSpecification.get("columns",[]))
+    return renderSpecificationFigures(plotSpecification,columnData)
+
+
+def main():
+    if(len(sys.argv)<2):
+        print("Usage: python batchPlotter.py specification.json [specification.json ...]")
+        return
+
+    failureCount=0
+    for currentSpecificationPath in sys.argv[1:]:
+        failureCount+=runPlotSpecification(currentSpecificationPath)
+
+    sys.exit(1 if(failureCount>0) else 0)
+
+
+if(__name__=="__main__"):
+    main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import numpy
+import matplotlib
+matplotlib.use("Agg") #Plots are drawn without a display so the time taken by plotColumnPairs can be measured anywhere.
+import matplotlib.pyplot as plt
+
+from equation import rpnTurnIntoList,rpnGetVariables,rpnParse,getDataForRpnExpression
+from calculus import integrateValues,differentiateValues
+from derivedColumns import createPolynomialFitValues
+from settings import getSetting
+import evFileCache
+import phantomEvFilePlotter
+
+
+#Measures how long the main stages of the plotter take and how much memory they use at several data sizes, using synthetic .ev files.
+#The results are saved as JSON so the results of different versions can be compared. Usage:
+# python benchmarks.py results.json [rowCount ...]
+# python benchmarks.py compare oldResults.json newResults.json
+#The synthetic files have 16 columns unless PHANTOM_EV_BENCHMARK_COLUMNS is set, and each stage is timed the best of
+#PHANTOM_EV_BENCHMARK_REPEATS (by default 3) times. The time taken for phantomEvFilePlotter.py to show its first prompt is also measured
+#and compared with PHANTOM_EV_STARTUP_BUDGET seconds.
+
+
+defaultRowCounts=[1000,10000,100000,1000000]
+startupBudget=getSetting("STARTUP_BUDGET",0.5) #The longest time in seconds phantomEvFilePlotter.py should take to show its first prompt.
+rpnParseMaximumRowCount=100000 #rpnParse evaluates an expression one row at a time, so it is only measured for smaller files.
+
+#Names of columns found in Phantom .ev files, used for the first columns of synthetic files.
+phantomColumnNames=["time","ekin","etherm","emag","epot","etot","totmom","angtot","rho max","rho ave","dt","totentrop","rmsmach","vrms",
+                    "xcom","ycom","zcom","alpha max","drag x","drag y","drag z","torque","separation","orbital energy"]
+
+
+#Writes a synthetic .ev file with a Phantom style header ([  1  time] [  2  ekin]...) and values written as Fortran writes them with the
+#ES18.10 format. The first column is an increasing time and the others are smooth curves with noise, so integrals, derivatives and fits
+#behave as they would for real files.
+def createSyntheticEvFile(fileName,rowCount,columnCount,randomSeed=0):
+    randomGenerator=numpy.random.default_rng(randomSeed)
+    columnNames=[phantomColumnNames[i] if(i<len(phantomColumnNames)) else "column "+str(i+1) for i in range(0,columnCount)]
+
+    with open(fileName,"w") as evFile:
+        evFile.write("#"+"".join([" [{:3d}  {:>14s}]".format(i+1,j) for i,j in enumerate(columnNames)])+"\n")
+
+        chunkSize=100000 #The values are created and written in chunks so large files do not need to be held in memory.
+        for chunkStart in range(0,rowCount,chunkSize):
+            rowIndices=numpy.arange(chunkStart,min(rowCount,chunkStart+chunkSize),dtype=numpy.float64)
+            chunkValues=numpy.empty((len(rowIndices),columnCount))
+            chunkValues[:,0]=rowIndices*0.1
+            for i in range(1,columnCount):
+                curveValues=(10.0**(i%7-3))*numpy.sin(rowIndices*(i/float(max(rowCount,1)))*20.0)*numpy.exp(-rowIndices/float(max(rowCount,1)))
+                chunkValues[:,i]=curveValues+randomGenerator.normal(0.0,1e-3*(10.0**(i%7-3)),len(rowIndices))
+            numpy.savetxt(evFile,chunkValues,fmt="%18.10E",delimiter="")
+
+
+#Runs a function repeatCount times and once more while tracing memory allocations. Returns the shortest time taken in seconds, the
+#peak memory allocated in bytes and the result of the function.
+def measureStage(stageFunction,repeatCount):
+    stageTimes=[]
+    for i in range(0,repeatCount):
+        startTime=time.perf_counter()
+        stageResult=stageFunction()
+        stageTimes.append(time.perf_counter()-startTime)
+        del stageResult
+
+    tracemalloc.start()
+    try:
+        stageResult=stageFunction()
+        peakMemory=tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return min(stageTimes),peakMemory,stageResult
+
+
+#Measures the shortest time taken over repeatCount runs for phantomEvFilePlotter.py to start and show its first prompt.
+def measureStartupTime(repeatCount):
+    plotterFileName=os.path.join(os.path.dirname(os.path.abspath(__file__)),"phantomEvFilePlotter.py")
+    startupTimes=[]
+
+    for i in range(0,repeatCount):
+        startTime=time.perf_counter()
+        plotterProcess=subprocess.Popen([sys.executable,plotterFileName],stdin=subprocess.PIPE,stdout=subprocess.PIPE)
+        plotterProcess.stdout.readline()
+        startupTimes.append(time.perf_counter()-startTime)
+        plotterProcess.kill()
+        plotterProcess.communicate()
+
+    return min(startupTimes)
+
+
+def plotAndDraw(columnData,curvesToPlot):
+    plotFigure=phantomEvFilePlotter.plotColumnPairs(columnData,curvesToPlot,("x","code units",1.0),("y","code units",1.0))
+    plotFigure.canvas.draw()
+    plt.close(plotFigure)
+
+
+#Measures every stage for a synthetic file with rowCount rows. Returns a dictionary associating the name of each stage with its time and
+#peak memory.
+def benchmarkRowCount(benchmarkDirectory,rowCount,columnCount,repeatCount):
+    evFileName=os.path.join(benchmarkDirectory,"synthetic"+str(rowCount)+".ev")
+    createSyntheticEvFile(evFileName,rowCount,columnCount)
+    stageResults={}
+
+    def addStage(stageName,stageFunction):
+        stageTime,peakMemory,stageResult=measureStage(stageFunction,repeatCount)
+        stageResults[stageName]={"seconds":stageTime,"peakBytes":peakMemory}
+        print(" {:>10d} rows  {:28s} {:10.4f} s {:12.1f} MiB".format(rowCount,stageName,stageTime,peakMemory/float(1<<20)))
+        return stageResult
+
+    evFileCache.cacheEnabled=False #Every repeat parses the file instead of reading it from the cache.
+    columnData=addStage("getColumnData",lambda:phantomEvFilePlotter.getColumnData([evFileName]))
+    xValues=columnData["1a"]["values"]
+    yValues=columnData["2a"]["values"]
+
+    expressionList=rpnTurnIntoList("2a 3a * 4a 2 ^ + abs 5a h *")
+    expressionVariables=rpnGetVariables(expressionList,list(columnData.keys()))
+    addStage("getDataForRpnExpression",lambda:getDataForRpnExpression(columnData,expressionList,expressionVariables))
+
+    if(rowCount<=rpnParseMaximumRowCount):
+        def parseEveryRow():
+            rowExpressionList=list(expressionList)
+            for i in range(0,rowCount):
+                for currentKey,currentIndex in expressionVariables:
+                    rowExpressionList[currentIndex]=str(columnData[currentKey]["values"][i])
+                rpnParse(rowExpressionList)
+        addStage("rpnParse",parseEveryRow)
+
+    addStage("integrateValues",lambda:integrateValues(xValues,yValues,0.0))
+    addStage("differentiateValues",lambda:differentiateValues(xValues,yValues,2))
+    addStage("createPolynomialFitValues",lambda:createPolynomialFitValues(xValues,yValues,5))
+    addStage("plotColumnPairs",lambda:plotAndDraw(columnData,[("1a",str(i)+"a",str(i)) for i in range(2,min(columnCount,6)+1)]))
+
+    return stageResults
+
+
+def runBenchmarks(outputFileName,rowCounts):
+    columnCount=getSetting("BENCHMARK_COLUMNS",16)
+    repeatCount=getSetting("BENCHMARK_REPEATS",3)
+    benchmarkResults={"python":platform.python_version(),"numpy":numpy.__version__,"matplotlib":matplotlib.__version__,
+                      "platform":platform.platform(),"processors":os.cpu_count(),"columns":columnCount,"repeats":repeatCount,"results":{}}
+
+    startupTime=measureStartupTime(repeatCount)
+    benchmarkResults["startup"]={"seconds":startupTime,"budgetSeconds":startupBudget,"withinBudget":startupTime<=startupBudget}
+    print(" Time to first prompt: {:.3f} s ({} the budget of {:.3f} s)".format(startupTime,"within" if(startupTime<=startupBudget) else "over",startupBudget))
+
+    with tempfile.TemporaryDirectory() as benchmarkDirectory:
+        for currentRowCount in rowCounts:
+            benchmarkResults["results"][str(currentRowCount)]=benchmarkRowCount(benchmarkDirectory,currentRowCount,columnCount,repeatCount)
+
+    with open(outputFileName,"w") as outputFile:
+        json.dump(benchmarkResults,outputFile,indent=1)
+    print("Results saved to "+outputFileName)
+
+
+#Prints how the times and peak memory of two sets of results compare, as the ratio of the new result to the old result.
+def compareBenchmarks(oldFileName,newFileName):
+    with open(oldFileName,"r") as oldFile:
+        oldResults=json.load(oldFile)["results"]
+    with open(newFileName,"r") as newFile:
+        newResults=json.load(newFile)["results"]
+
+    with open(oldFileName,"r") as oldFile:
+        oldStartup=json.load(oldFile).get("startup")
+    with open(newFileName,"r") as newFile:
+        newStartup=json.load(newFile).get("startup")
+    if((oldStartup is not None) and (newStartup is not None)):
+        print("Time to first prompt: {:.3f} s -> {:.3f} s".format(oldStartup["seconds"],newStartup["seconds"]))
+
+    print("{:>10s}  {:28s} {:>10s} {:>10s} {:>8s} {:>8s}".format("rows","stage","old s","new s","time","memory"))
+    for currentRowCount,currentStages in newResults.items():
+        for currentStageName,currentResult in currentStages.items():
+            oldResult=oldResults.get(currentRowCount,{}).get(currentStageName)
+            if(oldResult is None):
+                continue
+
+            timeRatio=currentResult["seconds"]/max(oldResult["seconds"],1e-9)
+            memoryRatio=currentResult["peakBytes"]/float(max(oldResult["peakBytes"],1))
+            print("{:>10s}  {:28s} {:10.4f} {:10.4f} {:7.2f}x {:7.2f}x".format(currentRowCount,currentStageName,oldResult["seconds"],currentResult["seconds"],timeRatio,memoryRatio))
+
+
+def main():
+    if(len(sys.argv)<2):
+        print("Usage: python benchmarks.py results.json [rowCount ...] or python benchmarks.py compare oldResults.json newResults.json")
+        return
+
+    if(sys.argv[1]=="compare"):
+        compareBenchmarks(sys.argv[2],sys.argv[3])
+    else:
+        runBenchmarks(sys.argv[1],[int(i) for i in sys.argv[2:]] if(len(sys.argv)>2) else defaultRowCounts)
+
+
+if(__name__=="__main__"):
+    main()
@@ -0,0 +1,59 @@
+import numpy
+
+
+#Integrates each row of yColumns over xValues while adding a constant of integration (one for each row, or one for all of them) to
+#the output values. Uses the area of a trapezium between each pair of neighbouring points, with the first output value being the
+#constant of integration. Returns an array with a row of integral values for each row of yColumns.
+def integrateColumns(xValues,yColumns,constantsOfIntegration):
+    xValues=numpy.asarray(xValues,dtype=numpy.float64)
+    yColumns=numpy.asarray(yColumns,dtype=numpy.float64)
+    if((yColumns.ndim!=2) or (yColumns.shape[1]!=len(xValues))):
+        print("Lengths of lists do not match.")
+        return None
+    if(len(xValues)==0):
+        return numpy.empty(yColumns.shape)
+
+    #The previous x and y values are equal to the current x and y values for the first element of the integral.
+    previousXValues=numpy.concatenate((xValues[0:1],xValues[0:-1]))
+    previousYColumns=numpy.concatenate((yColumns[:,0:1],yColumns[:,0:-1]),axis=1)
+
+    integralColumns=numpy.cumsum(0.5*(xValues-previousXValues)*(yColumns+previousYColumns),axis=1)
+    integralColumns+=numpy.reshape(constantsOfIntegration,(-1,1))
+    return integralColumns
+
+
+#Integrates yValues over xValues while adding a constant of integration to the output values.
+def integrateValues(xValues,yValues,constantOfIntegration):
+    if(len(xValues)!=len(yValues)):
+        print("Lengths of lists do not match.")
+        return None
+
+    return integrateColumns(xValues,[yValues],constantOfIntegration)[0]
+
+
+#Differentiates each row of yColumns with respect to xValues. The derivative is sampled between two points averageRadius away from the
+#central point, with the points being limited to the ends of the columns. Only the rows starting from startIndex are computed.
+def differentiateColumns(xValues,yColumns,averageRadius,startIndex=0):
+    xValues=numpy.asarray(xValues,dtype=numpy.float64)
+    yColumns=numpy.asarray(yColumns,dtype=numpy.float64)
+    if((yColumns.ndim!=2) or (yColumns.shape[1]!=len(xValues))):
+        print("Lengths of lists do not match.")
+        return None
+
+    #The maximum and minimum functions are used to ensure that indices outside of the columns are not used.
+    rowIndices=numpy.arange(startIndex,len(xValues))
+    leftIndices=numpy.maximum(0,rowIndices-averageRadius)
+    rightIndices=numpy.minimum(len(xValues)-1,rowIndices+averageRadius)
+
+    with numpy.errstate(divide="ignore",invalid="ignore"):
+        return (yColumns[:,rightIndices]-yColumns[:,leftIndices])/(xValues[rightIndices]-xValues[leftIndices])
+
+
+#Differentiates a list of values with respect to an equally sized other list of values. The derivative is sampled between
+#two points averageRadius away from the central point.
+def differentiateValues(xValues,yValues,averageRadius,startIndex=0):
+    if(len(xValues)!=len(yValues)):
+        print("Lengths of lists do not match.")
+        return None
+
+    return differentiateColumns(xValues,[yValues],averageRadius,startIndex)[0]
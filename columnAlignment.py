@@ -0,0 +1,60 @@
+import numpy
+
+from decimation import isMonotoneIncreasing
+import outOfCore
+
+
+#Columns from different files (such as runs with different time steps) can be combined in an RPN expression by first interpolating
+#each column onto a common grid of x values (usually the time) with numpy.interp, instead of pairing their rows by index. Each column
+#is interpolated from its own x column, which is usually the time column of its file. The grid is either an existing column or is made
+#from the x columns (see getAlignmentGrid). Grid values outside the range of a column's x values are NaN for that column.
+#Aligning is not done out of core: finding the grid and sorting the x values hold whole columns in memory even in out of core mode, and
+#only the interpolated columns are memory mapped.
+
+
+alignmentModes=["union","intersection"]
+
+
+#Gets a grid holding every x value of the given x columns in increasing order, without repeats or NaN values. If gridMode is
+#"intersection" only the x values where every x column has values (from the highest of their lowest values to the lowest of their
+#highest values) are kept.
+def getAlignmentGrid(xColumns,gridMode):
+    finiteColumns=[numpy.asarray(i,dtype=numpy.float64)[numpy.isfinite(i)] for i in xColumns]
+    gridValues=numpy.unique(numpy.concatenate(finiteColumns)) if(len(finiteColumns)!=0) else numpy.empty(0)
+
+    if(gridMode=="intersection"):
+        if(any([len(i)==0 for i in finiteColumns])):
+            return numpy.empty(0)
+        lowestValue=max([i.min() for i in finiteColumns])
+        highestValue=min([i.max() for i in finiteColumns])
+        gridValues=gridValues[numpy.searchsorted(gridValues,lowestValue,side="left"):numpy.searchsorted(gridValues,highestValue,side="right")]
+
+    return gridValues
+
+
+#Linearly interpolates a column onto a grid of x values. The x values of the column are sorted first if they ever decrease, such as for
+#a restarted run that has not been joined (see evFileMerger). In out of core mode the grid is interpolated a chunk at a time into a
+#memory mapped column.
+def interpolateOntoGrid(xValues,yValues,gridValues):
+    commonRowCount=min(len(xValues),len(yValues))
+    xValues=numpy.asarray(xValues[0:commonRowCount],dtype=numpy.float64)
+    yValues=numpy.asarray(yValues[0:commonRowCount],dtype=numpy.float64)
+
+    finiteRows=numpy.isfinite(xValues)
+    if(not finiteRows.all()):
+        xValues=xValues[finiteRows]
+        yValues=yValues[finiteRows]
+    if(not isMonotoneIncreasing(xValues)):
+        sortedOrder=numpy.argsort(xValues,kind="stable")
+        xValues=xValues[sortedOrder]
+        yValues=yValues[sortedOrder]
+
+    if(len(xValues)==0):
+        return numpy.full(len(gridValues),numpy.nan)
+    if(not outOfCore.outOfCoreEnabled):
+        return numpy.interp(gridValues,xValues,yValues,left=numpy.nan,right=numpy.nan)
+
+    alignedValues=outOfCore.createTemporaryColumn(len(gridValues))
+    for chunkStart,chunkEnd in outOfCore.getChunkRanges(len(gridValues)):
+        alignedValues[chunkStart:chunkEnd]=numpy.interp(gridValues[chunkStart:chunkEnd],xValues,yValues,left=numpy.nan,right=numpy.nan)
+    return alignedValues
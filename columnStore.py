@@ -0,0 +1,397 @@
+from collections.abc import MutableMapping
+import numpy
+
+from derivedColumns import getRecipeInputs,derivedColumnCache
+from evFileLoader import FileLoadError
+from profiling import profileStage
+from columnWindows import ColumnWindowIndex
+import outOfCore
+
+
+#Holds columns that can have values added to their ends. Space is reserved in advance (doubling each time it runs out) so adding
+#rows only costs as much as the number of rows added.
+class GrowableColumns:
+    def __init__(self,initialValues):
+        initialValues=numpy.asarray(initialValues,dtype=numpy.float64)
+        self.rowCount=initialValues.shape[1]
+        self.buffer=numpy.empty((initialValues.shape[0],max(1024,2*self.rowCount)),dtype=numpy.float64)
+        self.buffer[:,0:self.rowCount]=initialValues
+
+    def append(self,newValues):
+        newRowCount=self.rowCount+newValues.shape[1]
+
+        if(newRowCount>self.buffer.shape[1]):
+            newBuffer=numpy.empty((self.buffer.shape[0],2*newRowCount),dtype=numpy.float64)
+            newBuffer[:,0:self.rowCount]=self.buffer[:,0:self.rowCount]
+            self.buffer=newBuffer
+
+        self.buffer[:,self.rowCount:newRowCount]=newValues
+        self.rowCount=newRowCount
+
+    #The values are a view of the buffer, so they need to be fetched again after rows are appended.
+    def getValues(self,columnIndex):
+        return self.buffer[columnIndex,0:self.rowCount]
+
+
+#Information about a column: the file it came from, its name, its values, (for user created columns) the recipe used to create it
+#(see derivedColumns) and an identity that is the same whenever the column has the same values, even in different sessions (see
+#ColumnStore.getColumnIdentity). The values are always held as a numpy array of 64 bit floats, or 32 bit floats if they are given
+#as 32 bit floats to save memory. The fields can also be accessed like the keys of a dictionary
+#(such as record["values"]) as columns used to be stored as dictionaries. User created columns can be added without values, in which
+#case pendingEvaluation is called to compute the values the first time they are used. Columns of files can also be added before they
+#are loaded in the same way.
+class ColumnRecord:
+    __slots__=("fileName","columnName","columnValues","recipe","identity","pendingEvaluation")
+    recordFields=("fileName","columnName","values","recipe")
+
+    def __init__(self,fileName,columnName,values,recipe=None,identity=None):
+        self.fileName=fileName
+        self.columnName=columnName
+        self.values=values
+        self.recipe=recipe
+        self.identity=identity
+        self.pendingEvaluation=None
+
+    @property
+    def values(self):
+        if((self.columnValues is None) and (self.pendingEvaluation is not None)):
+            self.pendingEvaluation()
+        return self.columnValues
+
+    #Arrays that already hold floats (including memory mapped arrays and views of other arrays) are used without being copied.
+    @values.setter
+    def values(self,newValues):
+        if(newValues is None):
+            self.columnValues=None
+            return
+        
+        newValues=numpy.asarray(newValues)
+        self.columnValues=newValues if(newValues.dtype==numpy.float32) else newValues.astype(numpy.float64,copy=False)
+
+    def __getitem__(self,field):
+        if((field not in ColumnRecord.recordFields) or ((field=="recipe") and (self.recipe is None))):
+            raise KeyError(field)
+        return getattr(self,field)
+
+    def __setitem__(self,field,value):
+        if(field not in ColumnRecord.recordFields):
+            raise KeyError(field)
+        setattr(self,field,value)
+
+    def __contains__(self,field):
+        return (field in ColumnRecord.recordFields) and ((field!="recipe") or (self.recipe is not None))
+
+    def get(self,field,default=None):
+        return self[field] if(field in self) else default
+
+
+#Holds the columns that can be plotted, associating each column key with a ColumnRecord in the order the columns were added. The
+#columns of a file are views of the rows of a single array holding all of the file's values, so no values are copied when they are
+#added. Dictionaries holding the fields of a ColumnRecord can also be stored and are converted to ColumnRecords. User created columns
+#stored without values are computed when their values are first used. When a column is replaced, the user created columns made from
+#it are computed again once they are next used.
+class ColumnStore(MutableMapping):
+    def __init__(self):
+        self.columnRecords={}
+        self.unloadedColumns={} #Associates the keys of file columns that have not been loaded yet with the function that loads them, their index in the file and their number of rows.
+        self.scaledValues={} #Associates (column key,scale factor) pairs with the values the scaled values were made from, the scaled values and (once the column has grown) the GrowableColumns holding the scaled values.
+        self.windowIndices={} #Associates column keys with the values their window index was made from and the index.
+        self.fileDataEnds={} #Associates the names of loaded files with the position in the file after the last row that was read (see EvFileFollower).
+
+    def __getitem__(self,columnKey):
+        return self.columnRecords[columnKey]
+
+    def __setitem__(self,columnKey,columnRecord):
+        if(not isinstance(columnRecord,ColumnRecord)):
+            columnRecord=ColumnRecord(columnRecord["fileName"],columnRecord["columnName"],columnRecord["values"],columnRecord.get("recipe"))
+        
+        columnReplaced=(columnKey in self.columnRecords)
+        self.columnRecords[columnKey]=columnRecord
+        self.unloadedColumns.pop(columnKey,None)
+        if((columnRecord.columnValues is None) and (columnRecord.recipe is not None)):
+            columnRecord.pendingEvaluation=lambda:self.materializeColumns([columnKey])
+        if(columnReplaced):
+            self.invalidateColumn(columnKey)
+
+    def __delitem__(self,columnKey):
+        del self.columnRecords[columnKey]
+        self.unloadedColumns.pop(columnKey,None)
+
+    def __iter__(self):
+        return iter(self.columnRecords)
+
+    def __len__(self):
+        return len(self.columnRecords)
+
+
+    #Adds the columns of a file. fileValues is an array with a row for each column of the file, and columnIndices gives the row
+    #used for each column key. fileIdentity is a string that changes whenever the file changes, such as its cache entry name.
+    def addFileColumns(self,fileName,columnKeys,columnNames,columnIndices,fileValues,fileIdentity=None):
+        for currentKey,currentName,currentIndex in zip(columnKeys,columnNames,columnIndices):
+            columnIdentity=None if(fileIdentity is None) else fileIdentity+":"+str(currentIndex)
+            self.columnRecords[currentKey]=ColumnRecord(fileName,currentName,fileValues[currentIndex],identity=columnIdentity)
+
+
+    #Adds the columns of a file without loading them. Each column is loaded the first time its values are used, with columns of the same
+    #file that are needed at the same time (see materializeColumns) being loaded together. loadColumns is given a list of column indices
+    #and returns a list holding the values of each column (see loadEvFileColumnsCached). rowCount is the number of rows the file is
+    #thought to have, which is shown before the columns are loaded. For a file being parsed in the background rowCount is instead an object
+    #whose isParsed method tells whether the file has been parsed (see PrefetchedEvFile), and the number of rows is found by loading the
+    #column once it is needed.
+    def addUnloadedFileColumns(self,fileName,columnKeys,columnNames,columnIndices,rowCount,loadColumns,fileIdentity=None):
+        for currentKey,currentName,currentIndex in zip(columnKeys,columnNames,columnIndices):
+            columnIdentity=None if(fileIdentity is None) else fileIdentity+":"+str(currentIndex)
+            columnRecord=ColumnRecord(fileName,currentName,None,identity=columnIdentity)
+            columnRecord.pendingEvaluation=lambda currentKey=currentKey:self.loadFileColumns([currentKey])
+            self.columnRecords[currentKey]=columnRecord
+            self.unloadedColumns[currentKey]=(loadColumns,currentIndex,rowCount)
+
+
+    #Loads the file columns with the given keys that have not been loaded yet. The columns of each file are loaded at once. If a file cannot
+    #be loaded its columns and the user created columns made from them are removed before a FileLoadError is raised.
+    def loadFileColumns(self,columnKeys):
+        fileColumnKeys={} #Associates the function used to load the columns of each file with the keys of the columns to load.
+        for currentKey in dict.fromkeys(columnKeys):
+            if(currentKey in self.unloadedColumns):
+                fileColumnKeys.setdefault(self.unloadedColumns[currentKey][0],[]).append(currentKey)
+
+        for loadColumns,currentKeys in fileColumnKeys.items():
+            try:
+                loadedColumns=loadColumns([self.unloadedColumns[i][1] for i in currentKeys])
+            except Exception as loadError:
+                fileName=self.columnRecords[currentKeys[0]].fileName
+                self.removeUnloadedFileColumns(loadColumns)
+                raise FileLoadError("The file "+fileName+" could not be loaded: "+str(loadError))
+            
+            for currentKey,currentValues in zip(currentKeys,loadedColumns):
+                self.columnRecords[currentKey].values=currentValues
+                del self.unloadedColumns[currentKey]
+
+
+    #Removes the columns of a file that have not been loaded yet, given the function used to load them, along with the user created columns
+    #made from them.
+    def removeUnloadedFileColumns(self,loadColumns):
+        removedKeys={}
+        for currentKey in [i for i,j in self.unloadedColumns.items() if(j[0]==loadColumns)]:
+            removedKeys[currentKey]=None
+            removedKeys.update(dict.fromkeys(self.getDependentKeys(currentKey)))
+        
+        for currentKey in removedKeys:
+            del self[currentKey]
+
+
+    #Gets the keys of the file columns that have not been loaded yet that are needed to compute the given columns.
+    def getUnloadedInputKeys(self,columnKeys):
+        unloadedKeys=[]
+        checkedKeys=set()
+        remainingKeys=list(columnKeys)
+        
+        while(len(remainingKeys)>0):
+            currentKey=remainingKeys.pop()
+            if((currentKey in checkedKeys) or (currentKey not in self.columnRecords)):
+                continue
+            checkedKeys.add(currentKey)
+            
+            currentRecord=self.columnRecords[currentKey]
+            if(currentKey in self.unloadedColumns):
+                unloadedKeys.append(currentKey)
+            elif((currentRecord.columnValues is None) and (currentRecord.recipe is not None)):
+                remainingKeys.extend(getRecipeInputs(currentRecord.recipe))
+                
+        return unloadedKeys
+
+
+    def isMaterialized(self,columnKey):
+        return self.columnRecords[columnKey].columnValues is not None
+
+
+    #Gets the number of values in a column without computing the column if it is a user created column that has not been computed yet.
+    def getColumnLength(self,columnKey):
+        if(columnKey in self.unloadedColumns):
+            rowCount=self.unloadedColumns[columnKey][2]
+            if(not hasattr(rowCount,"isParsed")):
+                return rowCount
+            self.loadFileColumns([columnKey]) #Waits for the file to be parsed.
+            return len(self.columnRecords[columnKey].columnValues)
+        
+        columnRecord=self.columnRecords[columnKey]
+        if((columnRecord.columnValues is not None) or (columnRecord.recipe is None)):
+            return len(columnRecord.values)
+
+        recipe=columnRecord.recipe
+        if(recipe[0]=="l"):
+            return recipe[1]
+        if((recipe[0]=="e") and (len(recipe)>3)): #The columns are interpolated onto the grid column.
+            return self.getColumnLength(recipe[3])
+        if(recipe[0]=="e"): #Only rows common to all of the columns in the expression are used.
+            return min([self.getColumnLength(i) for i in getRecipeInputs(recipe)])
+        if(recipe[0]=="g"): #The length of a grid is only known once it is made.
+            return len(columnRecord.values)
+        if(recipe[0]=="w"):
+            startRow,endRow=self.getWindowRows(recipe[1],recipe[3],recipe[4])
+            return endRow-startRow
+        return self.getColumnLength(recipe[1])
+
+
+    #Gets whether the length of a column can be found without waiting for the files it is made from to be parsed in the background.
+    def isColumnReady(self,columnKey):
+        for currentKey in self.getUnloadedInputKeys([columnKey]):
+            rowCount=self.unloadedColumns[currentKey][2]
+            if(hasattr(rowCount,"isParsed") and (not rowCount.isParsed())):
+                return False
+            
+        return True
+
+
+    #Gets a string identifying the values of a column, or None if the column cannot be identified. The number of values is included
+    #so columns that grow (see EvFileFollower) get a new identity. User created columns that have not been computed yet are identified
+    #by their recipe.
+    def getColumnIdentity(self,columnKey):
+        columnRecord=self.columnRecords[columnKey]
+        if((columnRecord.columnValues is None) and (columnRecord.recipe is not None)):
+            columnIdentity=derivedColumnCache.getRecipeIdentity(self,columnRecord.recipe)
+        else:
+            columnIdentity=columnRecord.identity
+            
+        if(columnIdentity is None):
+            return None
+        return columnIdentity+":"+str(self.getColumnLength(columnKey))
+
+
+    #Computes the user created columns with the given keys that have not been computed yet. Integrals and derivatives are computed
+    #together where possible (see computeDerivedColumns). Columns whose input columns have different lengths are left empty. File
+    #columns that have not been loaded yet that are given or are needed to compute the columns are loaded first.
+    def materializeColumns(self,columnKeys):
+        self.loadFileColumns(self.getUnloadedInputKeys(columnKeys))
+        pendingKeys=[i for i in dict.fromkeys(columnKeys) if((i in self.columnRecords) and (not self.isMaterialized(i)) and (self.columnRecords[i].recipe is not None))]
+        if(len(pendingKeys)==0):
+            return
+
+        derivedColumns=derivedColumnCache.getDerivedColumns(self,[self.columnRecords[i].recipe for i in pendingKeys])
+        for currentKey,currentDerivedColumn in zip(pendingKeys,derivedColumns):
+            currentRecord=self.columnRecords[currentKey]
+            if(currentDerivedColumn is None):
+                print("The columns used to create the column \""+currentRecord.columnName+"\" have different lengths.")
+                currentRecord.values=numpy.empty(0)
+            else:
+                currentRecord.values=currentDerivedColumn[0]
+                currentRecord.identity=currentDerivedColumn[2]
+
+
+    #Gets the values of a column for computing other columns. User created columns that have not been computed yet are computed without
+    #being kept, so the values only use memory while they are needed.
+    def getTransientValues(self,columnKey):
+        columnRecord=self.columnRecords[columnKey]
+        if((columnRecord.columnValues is not None) or (columnRecord.recipe is None)):
+            return columnRecord.values
+
+        derivedColumn=derivedColumnCache.getDerivedColumns(self,[columnRecord.recipe],storeColumns=False)[0]
+        return numpy.empty(0) if(derivedColumn is None) else derivedColumn[0]
+
+
+    #Gets the keys of the user created columns that were made from a column, directly or through other user created columns, in the
+    #order they were added.
+    def getDependentKeys(self,columnKey):
+        dependedKeys=set([columnKey])
+        dependentKeys=[]
+        
+        for currentKey,currentRecord in self.columnRecords.items(): #User created columns come after the columns they were created from.
+            if((currentRecord.recipe is not None) and (not dependedKeys.isdisjoint(getRecipeInputs(currentRecord.recipe)))):
+                dependedKeys.add(currentKey)
+                dependentKeys.append(currentKey)
+                
+        return dependentKeys
+
+
+    #Removes the values of the user created columns made from a column, such as after the column has been replaced, so they are
+    #computed again when they are next used.
+    def invalidateColumn(self,columnKey):
+        for currentKey in self.getDependentKeys(columnKey):
+            currentRecord=self.columnRecords[currentKey]
+            currentRecord.values=None
+            currentRecord.identity=None
+            currentRecord.pendingEvaluation=lambda currentKey=currentKey:self.materializeColumns([currentKey])
+
+
+    #Gets a view of some of the values of a column without copying them.
+    def getValues(self,columnKey,startIndex=None,endIndex=None):
+        return self.columnRecords[columnKey].values[startIndex:endIndex]
+
+
+    #Gets the first row and one past the last row of the rows of a column with values from minimum to maximum (see ColumnWindowIndex). The
+    #index of the column is made once and kept until the values of the column change.
+    def getWindowRows(self,columnKey,minimum,maximum):
+        columnValues=self.columnRecords[columnKey].values
+        windowEntry=self.windowIndices.get(columnKey)
+        if((windowEntry is None) or (windowEntry[0] is not columnValues)):
+            windowEntry=(columnValues,ColumnWindowIndex(columnValues))
+            self.windowIndices[columnKey]=windowEntry
+
+        return windowEntry[1].getWindowRows(minimum,maximum)
+
+
+    #Gets the values of a column multiplied by a scale factor (such as the conversion factor for a unit). The scaled values are made once
+    #and shared by every caller using the same column and scale factor, until the values of the column change. The original values are
+    #returned if the scale factor is 1. Scaled values are always 64 bit floats, as unit conversion factors (such as for energies) can make
+    #32 bit floats overflow. The returned values must not be modified.
+    @profileStage("unit scaling")
+    def getScaledValues(self,columnKey,scaleFactor):
+        columnValues=self.columnRecords[columnKey].values
+        if(scaleFactor==1.0):
+            return columnValues
+
+        scaledEntry=self.scaledValues.get((columnKey,scaleFactor))
+        if((scaledEntry is None) or (scaledEntry[0] is not columnValues)):
+            scaledColumnValues=outOfCore.scaleColumnChunked(columnValues,scaleFactor) if(outOfCore.outOfCoreEnabled) else numpy.multiply(columnValues,scaleFactor,dtype=numpy.float64)
+            scaledColumnValues.flags.writeable=False
+            scaledEntry=(columnValues,scaledColumnValues,None)
+            self.scaledValues[(columnKey,scaleFactor)]=scaledEntry
+
+        return scaledEntry[1]
+
+
+    #Replaces the values of a column with values that have grown (such as the columns of a followed file, see EvFileFollower), of which the
+    #first keptRowCount rows are the same as the previous values. The scaled values of the column (see getScaledValues) are extended by
+    #scaling only the rows that have changed, so the time taken depends on the number of new rows instead of the length of the column.
+    def setGrownValues(self,columnKey,newValues,keptRowCount):
+        columnRecord=self.columnRecords[columnKey]
+        previousValues=columnRecord.columnValues
+        columnRecord.values=newValues
+        
+        for currentPair,currentEntry in list(self.scaledValues.items()):
+            if(currentPair[0]!=columnKey):
+                continue
+            if(currentEntry[0] is not previousValues): #The scaled values were made from other values, so they are made again when next used.
+                del self.scaledValues[currentPair]
+                continue
+            
+            scaledColumns=currentEntry[2]
+            if(scaledColumns is None): #The scaled values are copied into a GrowableColumns the first time the column grows.
+                scaledColumns=GrowableColumns(numpy.asarray(currentEntry[1][0:keptRowCount]).reshape((1,-1)))
+            scaledColumns.rowCount=min(scaledColumns.rowCount,keptRowCount)
+            scaledColumns.append(numpy.multiply(columnRecord.columnValues[scaledColumns.rowCount:],currentPair[1],dtype=numpy.float64).reshape((1,-1)))
+            
+            scaledColumnValues=scaledColumns.getValues(0)
+            scaledColumnValues.flags.writeable=False
+            self.scaledValues[currentPair]=(columnRecord.columnValues,scaledColumnValues,scaledColumns)
+
+
+    #Removes the scaled values made by getScaledValues apart from those for the (column key,scale factor) pairs in usedPairs.
+    def retainScaledValues(self,usedPairs):
+        self.scaledValues={i:j for i,j in self.scaledValues.items() if(i in usedPairs)}
+
+
+    #Gets the number of bytes used by the values of all of the columns. Columns that are views of the same array are only counted once.
+    #User created columns that have not been computed yet do not use any memory.
+    def getMemoryUsage(self):
+        usedArrays={}
+        for currentRecord in self.columnRecords.values():
+            if(currentRecord.columnValues is None):
+                continue
+            
+            baseArray=currentRecord.columnValues
+            while(isinstance(baseArray.base,numpy.ndarray)):
+                baseArray=baseArray.base
+            usedArrays[id(baseArray)]=baseArray.nbytes
+
+        return sum(usedArrays.values())
@@ -0,0 +1,66 @@
+import numpy
+
+from decimation import isMonotoneIncreasing
+
+
+windowBlockRows=1<<12 #The number of rows in each block of the index of a column that is not monotone.
+windowChunkRows=1<<20 #Columns are read this many rows at a time when their index is made, so memory mapped columns are never read all at once.
+
+
+#Finds the rows of a column (usually the time) that are within a range of values, so a column pair can be restricted to that range by
+#taking the same slice of both columns, without copying them. Columns that never decrease are searched with a binary search. For other
+#columns the lowest and highest values in each block of windowBlockRows rows are found once, so only the blocks at each end of the range
+#need to be searched. The window is then every row from the first row in the range to the last row in the range, which for columns that
+#are not monotone can include rows outside of the range.
+class ColumnWindowIndex:
+    def __init__(self,columnValues):
+        self.columnValues=columnValues
+        self.isMonotone=isMonotoneIncreasing(columnValues)
+        self.blockMinimums=None
+        self.blockMaximums=None
+
+        if(not self.isMonotone):
+            blockMinimums=[]
+            blockMaximums=[]
+            for chunkStart in range(0,len(columnValues),windowChunkRows): #Each chunk holds a whole number of blocks.
+                chunkValues=numpy.asarray(columnValues[chunkStart:chunkStart+windowChunkRows])
+                paddedValues=numpy.pad(chunkValues,(0,(-len(chunkValues))%windowBlockRows),constant_values=numpy.nan).reshape((-1,windowBlockRows))
+                blockMinimums.append(numpy.fmin.reduce(paddedValues,axis=1)) #fmin and fmax ignore NaN values.
+                blockMaximums.append(numpy.fmax.reduce(paddedValues,axis=1))
+
+            self.blockMinimums=numpy.concatenate(blockMinimums) if(len(blockMinimums)!=0) else numpy.empty(0)
+            self.blockMaximums=numpy.concatenate(blockMaximums) if(len(blockMaximums)!=0) else numpy.empty(0)
+
+
+    #Gets the first row and one past the last row of the window of rows with values from minimum to maximum (inclusive). Both are 0 if
+    #there are no rows in the range.
+    def getWindowRows(self,minimum,maximum):
+        if(self.isMonotone):
+            startRow=int(numpy.searchsorted(self.columnValues,minimum,side="left"))
+            endRow=int(numpy.searchsorted(self.columnValues,maximum,side="right"))
+            return (startRow,endRow) if(startRow<endRow) else (0,0)
+
+        with numpy.errstate(invalid="ignore"):
+            overlappingBlocks=numpy.flatnonzero((self.blockMaximums>=minimum)&(self.blockMinimums<=maximum))
+        if(len(overlappingBlocks)==0):
+            return 0,0
+
+        def getRowsInRange(blockIndex): #Gets the rows of a block with values in the range.
+            blockStart=blockIndex*windowBlockRows
+            blockValues=numpy.asarray(self.columnValues[blockStart:blockStart+windowBlockRows])
+            return blockStart+numpy.flatnonzero((blockValues>=minimum)&(blockValues<=maximum))
+
+        #A block overlapping the range does not always have values in it, such as a block whose values jump over the range.
+        startRow=None
+        for currentBlock in overlappingBlocks:
+            blockRows=getRowsInRange(currentBlock)
+            if(len(blockRows)!=0):
+                startRow=int(blockRows[0])
+                break
+        if(startRow is None):
+            return 0,0
+
+        for currentBlock in overlappingBlocks[::-1]:
+            blockRows=getRowsInRange(currentBlock)
+            if(len(blockRows)!=0):
+                return startRow,int(blockRows[-1])+1
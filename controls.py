@@ -2,24 +2,155 @@ import matplotlib
 import matplotlib.pyplot as plt
 from numpy import array_split
 
+from settings import getSetting
+from profiling import profileStage
+
+
+redrawDelay=getSetting("REDRAW_DELAY",100) #The time in milliseconds after the last use of a control before the plot is redrawn.
+
+
+#Creates the dictionary holding the state of the plot controls, matching how plotColumnPairs creates the plot.
+def createControlVariables():
+    return {"fontSize":matplotlib.rcParams["font.size"],"legendColumnCount":1,"legendVisible":True,"legendSplit":False,"xAxisUseScientificNotation":True,"yAxisUseScientificNotation":True,"xAxisTextVisible":True,"yAxisTextVisible":True,"rasterization":False}
+
+
+#Applies the state in controlVariables to a plot without creating the controls, giving the same result as using the controls to
+#reach that state. Used when plots are saved without being shown. Split legends are not supported as they are meant to be dragged.
+def applyControlVariables(plotFigure,controlVariables,xUnits,yUnits):
+    plotAxes=plotFigure.gca()
+    xAxisName,xAxisUnit=xUnits[0:2]
+    yAxisName,yAxisUnit=yUnits[0:2]
+    
+    if(plotAxes.get_legend() is not None): #Curves drawn as a collection are keyed by a colour bar instead of a legend.
+        if(controlVariables["legendColumnCount"]!=1):
+            (plotAxes.get_legend()).remove()
+            legendColumnCount=max(1,min(len(plotAxes.get_lines()),controlVariables["legendColumnCount"]))
+            plotAxes.legend(ncol=legendColumnCount,loc="best")
+        plt.setp(plotAxes.get_legend(),visible=controlVariables["legendVisible"])
+    
+    #Scientific notation is turned on when the plot is created, with the exponent multiplier being shown above the axis.
+    if(not controlVariables["xAxisUseScientificNotation"]):
+        plotAxes.ticklabel_format(axis="x",style="plain")
+        plotAxes.set_xlabel(xAxisName+" ("+xAxisUnit+")")
+    if(not controlVariables["yAxisUseScientificNotation"]):
+        plotAxes.ticklabel_format(axis="y",style="plain")
+        plotAxes.set_ylabel(yAxisName+" ("+yAxisUnit+")")
+    
+    plotAxes.tick_params(axis="x",labelbottom=controlVariables["xAxisTextVisible"])
+    plt.setp(plotAxes.get_xaxis().get_label(),visible=controlVariables["xAxisTextVisible"])
+    plotAxes.tick_params(axis="y",labelleft=controlVariables["yAxisTextVisible"])
+    plt.setp(plotAxes.get_yaxis().get_label(),visible=controlVariables["yAxisTextVisible"])
+    plotAxes.set_rasterization_zorder(0.0 if(controlVariables["rasterization"]) else None)
+    
+    fontSize=controlVariables["fontSize"]
+    plotAxes.tick_params(axis="both",labelsize=fontSize)
+    plotAxes.title.set_fontsize(fontSize)
+    plt.setp(plotAxes.get_xaxis().get_label(),fontsize=fontSize)
+    plt.setp(plotAxes.get_yaxis().get_label(),fontsize=fontSize)
+    for currentLegend in plotAxes.findobj(match=matplotlib.legend.Legend):
+        plt.setp(currentLegend.get_texts(),fontsize=fontSize)
+    if(getattr(plotFigure,"curveColorbar",None) is not None):
+        plotFigure.curveColorbar.ax.tick_params(labelsize=fontSize)
+
+
+#Redraws a figure once a set time has passed since the last redraw was requested, so changes made by several uses of the controls in
+#quick succession (such as holding down a button) are drawn together in one redraw. Changes that only affect legends are drawn by blitting
+#the legends over a copy of the figure drawn without them, which is kept until the figure is next fully drawn, so the curves are not
+#drawn again.
+class CanvasRedrawer:
+    def __init__(self,plotFigure,delay=redrawDelay):
+        self.plotFigure=plotFigure
+        self.fullRedrawPending=False
+        self.legendRedrawPending=False
+        self.legendlessBackground=None
+        self.drawCount=0 #The number of times the figure has been drawn, either fully or by blitting.
+        self.redrawTimer=plotFigure.canvas.new_timer(interval=delay)
+        self.redrawTimer.single_shot=True
+        self.redrawTimer.add_callback(self.redraw)
+        plotFigure.canvas.mpl_connect("draw_event",self.clearBackground) #The copy is out of date once the figure is drawn again, such as after zooming.
+
+
+    def clearBackground(self,event):
+        self.legendlessBackground=None
+        self.drawCount+=1
+
+
+    def requestRedraw(self):
+        self.fullRedrawPending=True
+        self.redrawTimer.stop() #The timer is restarted so the redraw happens after the last request.
+        self.redrawTimer.start()
+
+
+    def requestLegendRedraw(self):
+        self.legendRedrawPending=True
+        self.redrawTimer.stop()
+        self.redrawTimer.start()
+
+
+    @profileStage("controls: redraw")
+    def redraw(self):
+        canvas=self.plotFigure.canvas
+        if(self.fullRedrawPending or (not self.legendRedrawPending) or (not canvas.supports_blit)):
+            canvas.draw()
+        else:
+            allLegends=self.plotFigure.findobj(match=matplotlib.legend.Legend)
+            if(self.legendlessBackground is None): #The figure is drawn without the legends to get the copy of it.
+                plt.setp(allLegends,animated=True)
+                canvas.draw()
+                plt.setp(allLegends,animated=False) #Animated artists are left out when figures are saved, so this is only done while drawing the copy.
+                self.legendlessBackground=canvas.copy_from_bbox(self.plotFigure.bbox)
+            else:
+                canvas.restore_region(self.legendlessBackground)
+
+            for currentLegend in allLegends:
+                self.plotFigure.draw_artist(currentLegend)
+            canvas.blit(self.plotFigure.bbox)
+            self.drawCount+=1
+
+        self.fullRedrawPending=False
+        self.legendRedrawPending=False
+
+
+#Sets the label of an axis using scientific notation to include the exponent multiplier, which is hidden from above the axis. The exponent
+#is taken from the tick formatter so the figure does not need to be drawn first.
+def setScientificNotationLabel(currentAxis,axisName,axisUnit):
+    axisFormatter=currentAxis.get_major_formatter()
+    axisFormatter.set_locs(currentAxis.get_majorticklocs())
+    currentAxis.set_label_text(axisName+" ("+axisFormatter.get_offset()+" "+axisUnit+")")
+    plt.setp(currentAxis.get_offset_text(),visible=False)
+
 
 #Creates the figure with plot controls and the functions that run when the controls are used.
 def createControls(plotFigure,controlVariables,xUnits,yUnits):
     plotAxes=plotFigure.gca()
     xAxisName,xAxisUnit=xUnits[0:2]
     yAxisName,yAxisUnit=yUnits[0:2]
-    currentLines=plotAxes.get_lines()
+    currentLines=plotAxes.get_lines() #Empty if the curves are drawn as a collection, in which case there are no legends to change.
 
-    #The functions that run when the controls are used as created below.
+    #The functions that run when the controls are used as created below. They request redraws instead of drawing the figures themselves
+    #(see CanvasRedrawer).
     def toggleLegendVisibility():
+        if(len(currentLines)==0):
+            return
         controlVariables["legendVisibility"]=not controlVariables["legendVisibility"]
         plt.setp(plotAxes.get_legend(),visible=controlVariables["legendVisibility"])
-        plotFigure.canvas.draw()
+        plotRedrawer.requestLegendRedraw()
 
 
-    def createNewCombinedLegend(): #Creates a non split legend.
-        newCombinedLegend=plotAxes.legend(ncol=controlVariables["legendColumnCount"],loc="best")
+    lastCombinedLegend={} #Holds the last legend made by createNewCombinedLegend, the arguments used to place it and the number of draws of the figure when it was made.
+    def createNewCombinedLegend(previousLegend=None): #Creates a non split legend.
+        if(previousLegend is None):
+            legendPlacement={"loc":"best"}
+        elif((previousLegend is lastCombinedLegend.get("legend")) and (plotRedrawer.drawCount==lastCombinedLegend["drawCount"])):
+            legendPlacement=lastCombinedLegend["placement"] #The previous legend has not been drawn, so its frame does not show where it is yet.
+        else: #The new legend is placed where the previous one was drawn, as finding the best position again is slow for long curves.
+            previousBounds=previousLegend.legendPatch.get_bbox().bounds
+            upperLeftCorner=plotAxes.transAxes.inverted().transform((previousBounds[0],previousBounds[1]+previousBounds[3]))
+            legendPlacement={"loc":"upper left","bbox_to_anchor":tuple(upperLeftCorner),"borderaxespad":0.0}
+        
+        newCombinedLegend=plotAxes.legend(ncol=controlVariables["legendColumnCount"],**legendPlacement)
         newCombinedLegend.set_draggable(True)
+        lastCombinedLegend.update({"legend":newCombinedLegend,"placement":legendPlacement,"drawCount":plotRedrawer.drawCount})
 
     def removeAllLegends(): #Removes all legends from plotAxes.
         splitLegends=plotAxes.findobj(match=matplotlib.legend.Legend)
@@ -27,6 +158,8 @@ def createControls(plotFigure,controlVariables,xUnits,yUnits):
             currentSplitLegend.remove()
                     
     def legendSplitToggle(event):
+        if(len(currentLines)==0):
+            return
         controlVariables["legendSplit"]=not controlVariables["legendSplit"]
         removeAllLegends()
         
@@ -46,80 +179,76 @@ def createControls(plotFigure,controlVariables,xUnits,yUnits):
         else:
             createNewCombinedLegend()
                     
-        plotFigure.canvas.draw()
+        plotRedrawer.requestLegendRedraw()
                 
                         
     def increaseLegendColumnNumber(event):
-        if(controlVariables["legendSplit"]==False):
-            (plotAxes.get_legend()).remove() #The current legend is removed.
+        if((controlVariables["legendSplit"]==False) and (len(currentLines)!=0)):
+            previousLegend=plotAxes.get_legend()
+            previousLegend.remove() #The current legend is removed.
             controlVariables["legendColumnCount"]=min(len(currentLines),controlVariables["legendColumnCount"]+1)
-            createNewCombinedLegend()
-            plotFigure.canvas.draw()
+            createNewCombinedLegend(previousLegend)
+            plotRedrawer.requestLegendRedraw()
                     
                 
     def decreaseLegendColumnNumber(event):               
-        if(controlVariables["legendSplit"]==False):
-            (plotAxes.get_legend()).remove() #The current legend is removed.
+        if((controlVariables["legendSplit"]==False) and (len(currentLines)!=0)):
+            previousLegend=plotAxes.get_legend()
+            previousLegend.remove() #The current legend is removed.
             controlVariables["legendColumnCount"]=max(1,controlVariables["legendColumnCount"]-1)
-            createNewCombinedLegend()
-            plotFigure.canvas.draw()
+            createNewCombinedLegend(previousLegend)
+            plotRedrawer.requestLegendRedraw()
 
 
     def toggleXAxisScientificNotation(event):
         controlVariables["xAxisUseScientificNotation"]= not controlVariables["xAxisUseScientificNotation"]
         plotAxes.ticklabel_format(axis="x",style="sci" if(controlVariables["xAxisUseScientificNotation"]) else "plain",scilimits=(0,0),useMathText=True)
-        plotFigure.canvas.draw()
 
         if(controlVariables["xAxisUseScientificNotation"]):
-            exponentText=plotAxes.get_xaxis().get_offset_text()
-            plotAxes.set_xlabel(xAxisName+" ("+exponentText.get_text()+" "+xAxisUnit+")") #The exponent multiplier is placed in the axis label.
-            plt.setp(exponentText,visible=False) #The original exponent multipler is hidden.
+            setScientificNotationLabel(plotAxes.get_xaxis(),xAxisName,xAxisUnit) #The exponent multiplier is placed in the axis label.
         else:
             plotAxes.set_xlabel(xAxisName+" ("+xAxisUnit+")")
 
-        plotFigure.canvas.draw()
+        plotRedrawer.requestRedraw()
 
 
     def toggleYAxisScientificNotation(event):
         controlVariables["yAxisUseScientificNotation"]= not controlVariables["yAxisUseScientificNotation"]
         plotAxes.ticklabel_format(axis="y",style="sci" if(controlVariables["yAxisUseScientificNotation"]) else "plain",scilimits=(0,0),useMathText=True)
-        plotFigure.canvas.draw()
 
         if(controlVariables["yAxisUseScientificNotation"]):
-            exponentText=plotAxes.get_yaxis().get_offset_text()
-            plotAxes.set_ylabel(yAxisName+" ("+exponentText.get_text()+" "+yAxisUnit+")") #The exponent multiplier is placed in the axis label.
-            plt.setp(exponentText,visible=False) #The original exponent multipler is hidden.
+            setScientificNotationLabel(plotAxes.get_yaxis(),yAxisName,yAxisUnit) #The exponent multiplier is placed in the axis label.
         else:
             plotAxes.set_ylabel(yAxisName+" ("+yAxisUnit+")")
 
-        plotFigure.canvas.draw()
+        plotRedrawer.requestRedraw()
 
 
     def toggleXAxisText(event):
         controlVariables["xAxisTextVisible"]=not controlVariables["xAxisTextVisible"]
         plotAxes.tick_params(axis="x",labelbottom=controlVariables["xAxisTextVisible"])
         plt.setp(plotAxes.get_xaxis().get_label(),visible=controlVariables["xAxisTextVisible"])
-        plotFigure.canvas.draw()
+        plotRedrawer.requestRedraw()
 
     
     def toggleYAxisText(event):
         controlVariables["yAxisTextVisible"]=not controlVariables["yAxisTextVisible"]
         plotAxes.tick_params(axis="y",labelleft=controlVariables["yAxisTextVisible"])
         plt.setp(plotAxes.get_yaxis().get_label(),visible=controlVariables["yAxisTextVisible"])
-        plotFigure.canvas.draw()
+        plotRedrawer.requestRedraw()
 
 
     def toggleRasterization(event):
         controlVariables["rasterization"]=not controlVariables["rasterization"]
         button8.label.set_text("Disable curve rasterization" if(controlVariables["rasterization"]) else "Enable curve rasterization")
         plotAxes.set_rasterization_zorder(0.0 if(controlVariables["rasterization"]) else None)
-        plotFigure.canvas.draw()
-        controlFigure.canvas.draw()
+        plotRedrawer.requestRedraw()
+        controlRedrawer.requestRedraw()
 
 
     def updateFontSize(newFontSize): #Changes the font size of the tick labels, axis labels, title and legend/s.
         label1.set_text(str(newFontSize)) #Updates the text label that shows the current font size.
-        controlFigure.canvas.draw()
+        controlRedrawer.requestRedraw()
         
         plotAxes.tick_params(axis="both",labelsize=newFontSize)
         plotAxes.title.set_fontsize(newFontSize)
@@ -128,17 +257,18 @@ def createControls(plotFigure,controlVariables,xUnits,yUnits):
         allLegends=plotAxes.findobj(match=matplotlib.legend.Legend)
         for cl in allLegends:
             plt.setp(cl.get_texts(),fontsize=newFontSize)
+        if(getattr(plotFigure,"curveColorbar",None) is not None):
+            plotFigure.curveColorbar.ax.tick_params(labelsize=newFontSize)
+        plotRedrawer.requestRedraw()
 
     def decreaseFontSize(event):
         controlVariables["fontSize"]=max(1,controlVariables["fontSize"]-1)
         updateFontSize(controlVariables["fontSize"])
-        plotFigure.canvas.draw()
 
 
     def increaseFontSize(event):
         controlVariables["fontSize"]=min(50,controlVariables["fontSize"]+1)
         updateFontSize(controlVariables["fontSize"])
-        plotFigure.canvas.draw()
      
 
 
@@ -146,6 +276,8 @@ def createControls(plotFigure,controlVariables,xUnits,yUnits):
                             
     #The controls are created below.        
     controlFigure=plt.figure(figsize=(4,4))
+    plotRedrawer=CanvasRedrawer(plotFigure)
+    controlRedrawer=CanvasRedrawer(controlFigure)
     button1Axes=controlFigure.add_axes([0.3,0.62,0.4,0.1])
     button2Axes=controlFigure.add_axes([0.05,0.5,0.4,0.1])
     button3Axes=controlFigure.add_axes([0.55,0.5,0.4,0.1])
@@ -170,14 +302,15 @@ def createControls(plotFigure,controlVariables,xUnits,yUnits):
     button10=matplotlib.widgets.Button(ax=button10Axes,label="Increase font size")
     label1=matplotlib.pyplot.text(x=-0.22,y=0.3,s=str(controlVariables["fontSize"]))
                         
-    button1.on_clicked(legendSplitToggle)
-    button2.on_clicked(decreaseLegendColumnNumber)
-    button3.on_clicked(increaseLegendColumnNumber)
-    button4.on_clicked(toggleXAxisScientificNotation)
-    button5.on_clicked(toggleYAxisScientificNotation)
-    button6.on_clicked(toggleXAxisText)
-    button7.on_clicked(toggleYAxisText)
-    button8.on_clicked(toggleRasterization)
-    button9.on_clicked(decreaseFontSize)
-    button10.on_clicked(increaseFontSize)
-    return button1,button2,button3,button4,button5,button6,button7,button8,button9,button10,label1 #Returned so the objects that make up the controls exist outside the scope of this function.
\ No newline at end of file
+    #The time taken by each callback is recorded when profiling is enabled (see profiling).
+    button1.on_clicked(profileStage("controls: legendSplitToggle")(legendSplitToggle))
+    button2.on_clicked(profileStage("controls: decreaseLegendColumnNumber")(decreaseLegendColumnNumber))
+    button3.on_clicked(profileStage("controls: increaseLegendColumnNumber")(increaseLegendColumnNumber))
+    button4.on_clicked(profileStage("controls: toggleXAxisScientificNotation")(toggleXAxisScientificNotation))
+    button5.on_clicked(profileStage("controls: toggleYAxisScientificNotation")(toggleYAxisScientificNotation))
+    button6.on_clicked(profileStage("controls: toggleXAxisText")(toggleXAxisText))
+    button7.on_clicked(profileStage("controls: toggleYAxisText")(toggleYAxisText))
+    button8.on_clicked(profileStage("controls: toggleRasterization")(toggleRasterization))
+    button9.on_clicked(profileStage("controls: decreaseFontSize")(decreaseFontSize))
+    button10.on_clicked(profileStage("controls: increaseFontSize")(increaseFontSize))
+    return button1,button2,button3,button4,button5,button6,button7,button8,button9,button10,label1,plotRedrawer,controlRedrawer #Returned so the objects that make up the controls exist outside the scope of this function.
\ No newline at end of file
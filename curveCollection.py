@@ -0,0 +1,58 @@
+import numpy
+
+from settings import getSetting
+
+
+collectionCurveCount=getSetting("COLLECTION_CURVES",100) #Plots with at least this many curves draw them as a single collection.
+
+
+#Plots with many curves (such as one curve for each file of a sweep) draw them as one LineCollection instead of a Line2D for each curve,
+#so they are drawn in one call. Each curve is given a colour from the colour map by its position in the list of curves, and the curves are
+#keyed by a colour bar labelled with their legend names instead of a legend. Earlier curves are drawn on top of later ones, as they are
+#when each curve is a Line2D.
+
+
+#Acts as the line of one curve of a collection, so the curve can be given new data in the same way as a Line2D (such as by a
+#DecimatedLine) without replacing the paths of the other curves.
+class CollectionCurve:
+    def __init__(self,lineCollection,plotAxes,pathIndex):
+        self.lineCollection=lineCollection
+        self.axes=plotAxes
+        self.pathIndex=pathIndex
+
+
+    def set_data(self,xValues,yValues):
+        from matplotlib.path import Path
+        self.lineCollection.get_paths()[self.pathIndex]=Path(numpy.column_stack((xValues,yValues)))
+        self.lineCollection.stale=True
+
+
+#Creates a collection for curveCount curves on plotAxes, which is added to the axes by addCurveCollection once its curves have data.
+#Returns the collection and a CollectionCurve for each curve. The paths are in the reverse order of the curves as later paths are drawn
+#on top.
+def createCurveCollection(plotAxes,curveCount):
+    from matplotlib.collections import LineCollection
+    lineCollection=LineCollection([numpy.empty((0,2))]*curveCount,zorder=-1.0) #Below 0 so the curves are rasterized with the rasterization control.
+    lineCollection.set_array(numpy.arange(curveCount-1,-1,-1,dtype=numpy.float64))
+    lineCollection.set_clim(0.0,max(curveCount-1,1))
+    return lineCollection,[CollectionCurve(lineCollection,plotAxes,curveCount-1-i) for i in range(0,curveCount)]
+
+
+#Adds a collection to its axes, scaling the axes to its curves, and adds a colour bar with a tick for the legend names of some of the
+#curves. Returns the colour bar.
+def addCurveCollection(plotFigure,plotAxes,lineCollection,legendNames):
+    from matplotlib.ticker import FuncFormatter,MaxNLocator
+    plotAxes.add_collection(lineCollection,autolim=True)
+    plotAxes.autoscale_view()
+
+    curveColorbar=plotFigure.colorbar(lineCollection,ax=plotAxes,ticks=MaxNLocator(nbins=10,integer=True))
+    curveColorbar.ax.yaxis.set_major_formatter(FuncFormatter(lambda i,j:legendNames[int(i)] if(0<=int(i)<len(legendNames)) else ""))
+    curveColorbar.ax.invert_yaxis() #The first curve is at the top, as it would be in a legend.
+    return curveColorbar
+
+
+#Updates the data limits of the axes to include the current paths of a collection, as relim only includes lines.
+def updateCollectionLimits(plotAxes,lineCollection):
+    plotAxes.relim()
+    plotAxes.update_datalim(lineCollection.get_datalim(plotAxes.transData).get_points())
+    plotAxes.autoscale_view()
@@ -0,0 +1,77 @@
+import numpy
+
+
+decimationBlockRows=1<<20 #Curves are checked and decimated this many points at a time, so curves memory mapped from the disk are never read all at once.
+
+
+def isMonotoneIncreasing(values):
+    for blockStart in range(0,max(len(values)-1,0),decimationBlockRows):
+        blockValues=values[blockStart:blockStart+decimationBlockRows+1] #Each block overlaps the next by one point.
+        if(not numpy.all(blockValues[1:]>=blockValues[0:-1])):
+            return False
+
+    return True
+
+
+#Reduces a curve to the first and last points and the points with the lowest and highest y values in each of bucketCount equally sized
+#groups of consecutive points. This keeps the shape of peaks and spikes as every extreme value is still drawn. Returns the indices of
+#the kept points in increasing order.
+def getMinMaxIndices(yValues,bucketCount):
+    pointCount=len(yValues)
+    if(pointCount<=4*bucketCount): #There is nothing to be gained from decimating the curve.
+        return numpy.arange(pointCount)
+
+    bucketSize=-(-pointCount//bucketCount) #Rounds up.
+    fullBucketPointCount=(pointCount//bucketSize)*bucketSize
+    keptIndices=[numpy.array([0,pointCount-1])]
+    
+    blockSize=max(1,decimationBlockRows//bucketSize)*bucketSize #Blocks hold a whole number of buckets.
+    for blockStart in range(0,fullBucketPointCount,blockSize):
+        blockEnd=min(fullBucketPointCount,blockStart+blockSize)
+        bucketValues=numpy.asarray(yValues[blockStart:blockEnd]).reshape((-1,bucketSize))
+        bucketStarts=numpy.arange(blockStart,blockEnd,bucketSize)
+        keptIndices.extend([bucketStarts+numpy.argmin(bucketValues,axis=1),bucketStarts+numpy.argmax(bucketValues,axis=1)])
+
+    if(fullBucketPointCount<pointCount): #The points left over at the end form a smaller bucket.
+        keptIndices.append(fullBucketPointCount+numpy.array([numpy.argmin(yValues[fullBucketPointCount:]),numpy.argmax(yValues[fullBucketPointCount:])]))
+
+    return numpy.unique(numpy.concatenate(keptIndices))
+
+
+#Draws a decimated version of a curve on a line, with the number of points depending on the width of the axes in pixels. The curve is
+#decimated again from the full resolution data whenever the x axis limits or the size of the figure changes, so zooming in shows every point.
+class DecimatedLine:
+    def __init__(self,line,xValues,yValues):
+        self.line=line
+        self.plotAxes=line.axes
+        self.setData(xValues,yValues)
+
+        self.plotAxes.callbacks.connect("xlim_changed",self.updateDecimation)
+        self.plotAxes.figure.canvas.mpl_connect("resize_event",self.updateDecimation)
+
+
+    #Replaces the full resolution data. All of the data is decimated so the axes can be autoscaled to it.
+    def setData(self,xValues,yValues):
+        commonPointCount=min(len(xValues),len(yValues))
+        self.xValues=numpy.asarray(xValues)[0:commonPointCount]
+        self.yValues=numpy.asarray(yValues)[0:commonPointCount]
+        self.xIsMonotone=isMonotoneIncreasing(self.xValues)
+        self.drawDecimated(0,commonPointCount)
+
+
+    def drawDecimated(self,startIndex,endIndex):
+        bucketCount=max(1,int(self.plotAxes.get_window_extent().width))
+        keptIndices=startIndex+getMinMaxIndices(self.yValues[startIndex:endIndex],bucketCount)
+        self.line.set_data(self.xValues[keptIndices],self.yValues[keptIndices])
+
+
+    def updateDecimation(self,event=None):
+        startIndex=0
+        endIndex=len(self.xValues)
+
+        if(self.xIsMonotone): #Only the visible part of the curve (and one point either side so the curve reaches the edges) is decimated.
+            xMinimum,xMaximum=sorted(self.plotAxes.get_xlim())
+            startIndex=max(0,int(numpy.searchsorted(self.xValues,xMinimum,side="left"))-1)
+            endIndex=min(len(self.xValues),int(numpy.searchsorted(self.xValues,xMaximum,side="right"))+1)
+
+        self.drawDecimated(startIndex,endIndex)
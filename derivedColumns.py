@@ -0,0 +1,232 @@
+import hashlib
+import json
+from collections import OrderedDict
+import numpy
+
+from equation import rpnCompile,rpnCompiledVariables,rpnReplaceVariables,getDataForCompiledExpression
+from calculus import integrateColumns,differentiateColumns
+from settings import getSetting
+from profiling import profileStage
+import evFileCache
+import outOfCore
+from polynomialFitting import fitPolynomialWindows,evaluatePolynomialFit
+from columnAlignment import getAlignmentGrid,interpolateOntoGrid
+
+
+derivedCacheMaximumBytes=getSetting("DERIVED_CACHE_MAXIMUM_BYTES",1<<30) #The memory used by cached user created columns is kept below this.
+alignmentWarningShown=False #Whether the warning that grids and aligned expressions are computed in memory in out of core mode has been printed.
+
+
+#User created columns are described by recipes, which are tuples holding the operation used to create the column followed by its
+#inputs and parameters:
+# ("l",elementCount,startingElement,endingElement) for a linearly spaced column.
+# ("e",expressionList,expressionVariables) for a column computed from an RPN expression (see getValidRpnExpression), or
+# ("e",expressionList,expressionVariables,gridKey,xKeys) for an expression whose columns are first interpolated onto the values of the
+# column gridKey, where xKeys holds a (column key,x column key) pair for each column in the expression (see columnAlignment).
+# ("g",gridMode,xKey1,xKey2...) for a grid made from the values of the columns xKey1, xKey2... (see getAlignmentGrid).
+# ("i",xKey,yKey,constantOfIntegration) for the integral of the column yKey with respect to the column xKey.
+# ("d",xKey,yKey,averageRadius) for the derivative of the column yKey with respect to the column xKey.
+# ("p",xKey,yKey,fitOrder) for a polynomial fitted to the columns xKey and yKey, or ("p",xKey,yKey,fitOrder,fitWindows,windowsByX) for
+# a polynomial fitted separately over each window (see fitPolynomialWindows).
+# ("w",xKey,yKey,minimum,maximum) for the rows of the column yKey where the column xKey is from minimum to maximum (see
+# ColumnStore.getWindowRows), which is a view of the column yKey.
+#User created columns are only computed once their values are needed (see ColumnStore.materializeColumns). Columns they are made from
+#that have not been computed yet are computed without being kept, and RPN expressions using columns made from other RPN expressions
+#are combined into a single expression.
+
+
+#Gets the keys of the columns a recipe uses.
+def getRecipeInputs(recipe):
+    if(recipe[0]=="e"):
+        alignmentKeys=[recipe[3]]+[i[1] for i in recipe[4]] if(len(recipe)>3) else []
+        return list(OrderedDict.fromkeys([i[0] for i in recipe[2]]+alignmentKeys))
+    if(recipe[0]=="g"):
+        return list(OrderedDict.fromkeys(recipe[2:]))
+    if(recipe[0] in ["i","d","p","w"]):
+        return [recipe[1],recipe[2]]
+
+    return []
+
+
+def createLinearColumnValues(elementCount,startingElement,endingElement):
+    differenceBetweenElements=(endingElement-startingElement)/(float(elementCount)-1.0)
+    return [startingElement+(float(i)*differenceBetweenElements) for i in range(0,elementCount)]
+
+
+#Fits a polynomial to two columns, a chunk of rows at a time (see polynomialFitting). Returns the fit coefficients (in order from the
+#lowest to highest power) and the fitted values for each x value, or None if the columns have different lengths. If fitWindows is given
+#a polynomial is fitted over each window, the coefficients are a list for each window and rows outside every window are NaN.
+def createPolynomialFitValues(xData,yData,fitOrder,fitWindows=None,windowsByX=False):
+    if(len(xData)!=len(yData)):
+        return None
+
+    polynomialFit,fitCoefficients=fitPolynomialWindows(xData,yData,fitOrder,fitWindows,windowsByX)
+    fittedValues=evaluatePolynomialFit(xData,polynomialFit)
+    return (fitCoefficients[0] if(fitWindows is None) else fitCoefficients),fittedValues
+
+
+#Gets a compiled RPN expression in which the columns made from RPN expressions that have not been computed yet are replaced by their
+#own expressions, so a chain of expressions is computed at once without creating the columns in between. Expressions interpolated onto
+#a grid are not replaced, as their rows do not match the rows of their columns.
+def getFusedExpression(columnData,compiledExpression):
+    def getReplacement(columnKey):
+        columnRecord=columnData[columnKey]
+        if((columnRecord.recipe is None) or (columnRecord.recipe[0]!="e") or (len(columnRecord.recipe)>3) or columnData.isMaterialized(columnKey)):
+            return None
+        return getFusedExpression(columnData,rpnCompile(list(columnRecord.recipe[1])))
+
+    return rpnReplaceVariables(compiledExpression,getReplacement)
+
+
+#Computes the values of columns from their recipes. In out of core mode expressions, integrals, derivatives and fits are computed a chunk of
+#rows at a time into memory mapped columns (see outOfCore), while grids and aligned expressions still hold their input columns in memory
+#(see columnAlignment), which is warned about the first time it happens. Returns a list holding the values and a dictionary of extra information (the fit
+#coefficients for polynomial fits) for each recipe, or None for recipes whose input columns have different lengths. Integrals and
+#derivatives with the same x column and parameter are computed together.
+@profileStage("user created columns")
+def computeDerivedColumns(columnData,recipes):
+    derivedColumns=[None]*len(recipes)
+    recipeGroups=OrderedDict() #Associates the operation, x column key and parameter of integrals and derivatives with the indices of their recipes.
+    global alignmentWarningShown
+    if(outOfCore.outOfCoreEnabled and (not alignmentWarningShown) and any([(i[0]=="g") or ((i[0]=="e") and (len(i)>3)) for i in recipes])):
+        alignmentWarningShown=True
+        print("Grids and aligned expressions are computed in memory even in out of core mode, so they need about as much memory as the columns they are made from.")
+
+    for i,currentRecipe in enumerate(recipes):
+        operation=currentRecipe[0]
+
+        if(operation=="l"):
+            derivedColumns[i]=(numpy.array(createLinearColumnValues(*currentRecipe[1:4])),{})
+        elif(operation=="e"):
+            if(len(currentRecipe)>3): #Each column is interpolated from its x column onto the grid, so the rows of every column have the same x value.
+                fusedExpression=rpnCompile(list(currentRecipe[1]))
+                gridValues=columnData.getTransientValues(currentRecipe[3])
+                columnValues={j:interpolateOntoGrid(columnData.getTransientValues(k),columnData.getTransientValues(j),gridValues) for j,k in currentRecipe[4]}
+            else:
+                fusedExpression=getFusedExpression(columnData,rpnCompile(list(currentRecipe[1])))
+                columnValues={j:columnData.getTransientValues(j) for j in rpnCompiledVariables(fusedExpression)}
+            if(outOfCore.outOfCoreEnabled):
+                derivedColumns[i]=(outOfCore.evaluateCompiledExpressionChunked(fusedExpression,columnValues),{})
+            else:
+                derivedColumns[i]=(getDataForCompiledExpression(fusedExpression,columnValues),{})
+        elif(operation=="p"):
+            fitResult=createPolynomialFitValues(columnData.getTransientValues(currentRecipe[1]),columnData.getTransientValues(currentRecipe[2]),*currentRecipe[3:6])
+            if(fitResult is not None):
+                derivedColumns[i]=(fitResult[1],{"coefficients":list(fitResult[0])})
+        elif(operation=="g"):
+            derivedColumns[i]=(getAlignmentGrid([columnData.getTransientValues(j) for j in currentRecipe[2:]],currentRecipe[1]),{})
+        elif(operation=="w"):
+            if(columnData.getColumnLength(currentRecipe[1])==columnData.getColumnLength(currentRecipe[2])):
+                startRow,endRow=columnData.getWindowRows(currentRecipe[1],currentRecipe[3],currentRecipe[4])
+                derivedColumns[i]=(columnData.getTransientValues(currentRecipe[2])[startRow:endRow],{})
+        elif(columnData.getColumnLength(currentRecipe[1])==columnData.getColumnLength(currentRecipe[2])):
+            recipeGroups.setdefault((operation,currentRecipe[1],currentRecipe[3]),[]).append(i)
+
+    for currentGroup,recipeIndices in recipeGroups.items():
+        operation,xKey,recipeParameter=currentGroup
+        if(outOfCore.outOfCoreEnabled): #The columns are computed one at a time so they are never all held in memory.
+            chunkedFunction=outOfCore.integrateColumnChunked if(operation=="i") else outOfCore.differentiateColumnChunked
+            for i in recipeIndices:
+                derivedColumns[i]=(chunkedFunction(columnData.getTransientValues(xKey),columnData.getTransientValues(recipes[i][2]),recipeParameter),{})
+            continue
+        
+        yColumns=numpy.array([columnData.getTransientValues(recipes[i][2]) for i in recipeIndices],dtype=numpy.float64)
+
+        if(operation=="i"):
+            groupValues=integrateColumns(columnData.getTransientValues(xKey),yColumns,recipeParameter)
+        else:
+            groupValues=differentiateColumns(columnData.getTransientValues(xKey),yColumns,recipeParameter)
+
+        for i,currentValues in zip(recipeIndices,groupValues):
+            derivedColumns[i]=(currentValues,{})
+
+    return derivedColumns
+
+
+#Keeps the values of user created columns so the same column does not need to be computed again, such as when it is created again
+#in a later session. Columns are found by an identity made from their recipe and the identities of their input columns (see
+#ColumnStore.getColumnIdentity), so the cached values are no longer used once any of the columns they were computed from change.
+#The least recently used columns are removed once the cached columns use more than maximumBytes of memory. Columns are also stored
+#in the file cache (see evFileCache) when it is enabled, so they are kept between sessions.
+class DerivedColumnCache:
+    def __init__(self,maximumBytes=derivedCacheMaximumBytes):
+        self.maximumBytes=maximumBytes
+        self.cachedColumns=OrderedDict() #Associates identities with values and extra information, from least to most recently used.
+        self.cachedBytes=0
+
+
+    #Gets the identity of the column made by a recipe, or None if any of the input columns do not have an identity.
+    def getRecipeIdentity(self,columnData,recipe):
+        inputIdentities={i:columnData.getColumnIdentity(i) for i in getRecipeInputs(recipe)}
+        if(None in inputIdentities.values()):
+            return None
+
+        if(recipe[0]=="e"): #The column keys in the expression are replaced by the identities of the columns.
+            identityRecipe=list(recipe[1])
+            for currentKey,currentIndex in recipe[2]:
+                identityRecipe[currentIndex]=inputIdentities[currentKey]
+            identityRecipe=["e",identityRecipe]
+            if(len(recipe)>3): #The grid and x columns are identified in the same order as the pairs of column keys.
+                identityRecipe.append([inputIdentities[recipe[3]]]+[inputIdentities[i[1]] for i in recipe[4]])
+        else:
+            identityRecipe=[recipe[0]]+[inputIdentities.get(i,i) if(isinstance(i,str)) else i for i in recipe[1:]]
+
+        return hashlib.sha1(json.dumps(identityRecipe).encode()).hexdigest()
+
+
+    def addCachedColumn(self,columnIdentity,derivedColumn):
+        self.cachedColumns[columnIdentity]=derivedColumn
+        self.cachedBytes+=derivedColumn[0].nbytes
+
+        while((self.cachedBytes>self.maximumBytes) and (len(self.cachedColumns)>1)):
+            removedColumn=self.cachedColumns.popitem(last=False)[1]
+            self.cachedBytes-=removedColumn[0].nbytes
+
+
+    def getCachedColumn(self,columnIdentity):
+        if(columnIdentity in self.cachedColumns):
+            self.cachedColumns.move_to_end(columnIdentity)
+            return self.cachedColumns[columnIdentity]
+
+        if(evFileCache.cacheEnabled):
+            cachedEntry=evFileCache.loadCacheValues("derived-"+columnIdentity)
+            if(cachedEntry is not None):
+                self.addCachedColumn(columnIdentity,(cachedEntry[1],cachedEntry[0]["information"]))
+                return self.cachedColumns[columnIdentity]
+
+        return None
+
+
+    #Does the same as computeDerivedColumns, but only computes columns that are not in the cache. Returns a list holding the values,
+    #extra information and identity of each column, or None for columns that could not be computed. Computed columns are not added
+    #to the cache if storeColumns is False, such as for columns only needed to compute other columns.
+    def getDerivedColumns(self,columnData,recipes,storeColumns=True):
+        derivedColumns=[None]*len(recipes)
+        columnIdentities=[self.getRecipeIdentity(columnData,i) for i in recipes]
+        uncachedIndices=[]
+
+        for i,currentIdentity in enumerate(columnIdentities):
+            cachedColumn=None if(currentIdentity is None) else self.getCachedColumn(currentIdentity)
+            if(cachedColumn is None):
+                uncachedIndices.append(i)
+            else:
+                derivedColumns[i]=(cachedColumn[0],cachedColumn[1],currentIdentity)
+
+        computedColumns=computeDerivedColumns(columnData,[recipes[i] for i in uncachedIndices])
+        for i,currentColumn in zip(uncachedIndices,computedColumns):
+            if(currentColumn is None):
+                continue
+
+            derivedColumns[i]=(currentColumn[0],currentColumn[1],columnIdentities[i])
+            if(storeColumns and (columnIdentities[i] is not None) and (recipes[i][0]!="w")): #Windows are views of other columns, so they are not kept.
+                self.addCachedColumn(columnIdentities[i],currentColumn)
+                if(evFileCache.cacheEnabled):
+                    try:
+                        evFileCache.storeCacheValues("derived-"+columnIdentities[i],{"information":currentColumn[1]},currentColumn[0])
+                    except OSError as cacheError:
+                        print("A user created column could not be stored in the cache: "+str(cacheError))
+
+        return derivedColumns
+
+
+derivedColumnCache=DerivedColumnCache()
@@ -1,4 +1,6 @@
-import regex
+import numpy
+
+from profiling import profileStage
 
 #Operators with one argument.
 def rpnTokenIs1Operator(token):
@@ -27,6 +29,7 @@ def rpnTokenIsVariable(token):
 
 #Turns an RPN expression into a list of tokens.
 def rpnTurnIntoList(expressionString):     
+    import regex #Only imported when an expression is first entered, so the program starts faster.
     foundTokens=regex.findall("(?<=(^| ))([^ ]*)(?=($| ))",expressionString) #Finds all text separated by spaces.
     outputList=[i[1] for i in foundTokens] #Removes the spaces to the sides of the found tokens.
     return outputList
@@ -82,6 +85,7 @@ def getValidRpnExpression(allowedVariableList):
  
 
 #Parses an RPN expression (in list form) and returns the result
+@profileStage("RPN parsing")
 def rpnParse(expressionList):
     rpnStack=[]
     
@@ -126,28 +130,112 @@ def rpnParse(expressionList):
     return rpnStack[0] #The size of the stack at the end will be one element and this element is the answer to the expression.
 
 
-#Creates a list of datapoints to be computed from an RPN expression containing references to columns.
-def getDataForRpnExpression(columnData,expressionList,expressionVariables):
-    expressionResult=[] #A list to hold all the computed datapoints.
+#The numpy functions that carry out each operator on whole columns at once. The Heaviside step function matches rpnParse
+#by giving 1.0 for zero and for NaN values.
+rpnColumnOperators1={"h":lambda rightValues:numpy.where(rightValues<0.0,0.0,1.0),
+                     "abs":numpy.abs}
+rpnColumnOperators2={"+":numpy.add,
+                     "-":numpy.subtract,
+                     "*":numpy.multiply,
+                     "/":numpy.true_divide,
+                     "^":numpy.float_power} #float_power uses the same C library function as the ** operator, so results are identical to rpnParse.
+
+
+#Compiles a valid RPN expression (in list form) into a tree of column operations. Each node is a tuple whose first element
+#is the node type: ("number",value), ("variable",key), ("operator1",token,rightNode) or ("operator2",token,leftNode,rightNode).
+#Operations on numbers only are carried out during compilation so they are not repeated for every row.
+@profileStage("RPN compilation")
+def rpnCompile(expressionList):
+    if(not rpnCheckValidExpression(expressionList)):
+        return None
     
-    currentRow=0
-    commonDatapointsExist=True
-    while(commonDatapointsExist): #This loop goes through all rows common to the variables columns in the expression.
-        
-        #This loop replaces the variables in expressionList with values from the correct columns.
-        for currentVariable in expressionVariables:
-            currentVariableKey=currentVariable[0]
-            currentColumnData=columnData[currentVariableKey]["values"]
-                        
-            currentDatapoint=currentColumnData[currentRow]
-            currentVariableIndex=currentVariable[1] #The index of the element in expressionList to be replaced by the data corresponding to currentDatapoint
-            expressionList[currentVariableIndex]=str(currentDatapoint) #The RPN parser expects all tokens to be strings.
+    nodeStack=[]
+    
+    for currentToken in expressionList:
+        if(rpnTokenIsNumber(currentToken)):
+            nodeStack.append(("number",float(currentToken)))
+        elif(rpnTokenIs1Operator(currentToken)):
+            rightNode=nodeStack.pop()
             
-            if((currentRow+1)==len(currentColumnData)):
-                commonDatapointsExist=False #There is no further data in at least one of the columns, so further iterations of the while loop are stopped.
+            if(rightNode[0]=="number"):
+                nodeStack.append(("number",rpnEvaluateCompiled(("operator1",currentToken,rightNode),{})))
+            else:
+                nodeStack.append(("operator1",currentToken,rightNode))
+        elif(rpnTokenIs2Operator(currentToken)):
+            rightNode=nodeStack.pop()
+            leftNode=nodeStack.pop()
+            
+            if((leftNode[0]=="number")and(rightNode[0]=="number")):
+                nodeStack.append(("number",rpnEvaluateCompiled(("operator2",currentToken,leftNode,rightNode),{})))
+            else:
+                nodeStack.append(("operator2",currentToken,leftNode,rightNode))
+        else:
+            nodeStack.append(("variable",currentToken))
+            
+    return nodeStack[0]
+
+
+#Gets the keys of all the columns referenced in a compiled RPN expression in the order they first appear.
+def rpnCompiledVariables(compiledExpression):
+    if(compiledExpression[0]=="variable"):
+        return [compiledExpression[1]]
+    
+    variableKeys=[]
+    for currentNode in compiledExpression[2:]:
+        for currentKey in rpnCompiledVariables(currentNode):
+            if(currentKey not in variableKeys):
+                variableKeys.append(currentKey)
                 
-        currentComputedDatapoint=rpnParse(expressionList)
-        expressionResult.append(currentComputedDatapoint) #The datapoint computed from the expression is added to the result list.
-        currentRow+=1
-        
-    return expressionResult
\ No newline at end of file
+    return variableKeys
+
+
+#Evaluates a compiled RPN expression over whole columns. variableValues associates each variable key with an equally sized numpy array.
+def rpnEvaluateCompiled(compiledExpression,variableValues):
+    nodeType=compiledExpression[0]
+    
+    if(nodeType=="number"):
+        return numpy.float64(compiledExpression[1])
+    if(nodeType=="variable"):
+        return variableValues[compiledExpression[1]]
+    if(nodeType=="operator1"):
+        rightValues=rpnEvaluateCompiled(compiledExpression[2],variableValues)
+        return rpnColumnOperators1[compiledExpression[1]](rightValues)
+    
+    leftValues=rpnEvaluateCompiled(compiledExpression[2],variableValues)
+    rightValues=rpnEvaluateCompiled(compiledExpression[3],variableValues)
+    
+    with numpy.errstate(divide="ignore",invalid="ignore",over="ignore"):
+        return rpnColumnOperators2[compiledExpression[1]](leftValues,rightValues)
+
+
+#Replaces the variables of a compiled RPN expression with other compiled expressions. getReplacement is given the key of each variable
+#and returns the compiled expression to put in its place, or None if the variable is kept.
+def rpnReplaceVariables(compiledExpression,getReplacement):
+    if(compiledExpression[0]=="variable"):
+        replacementExpression=getReplacement(compiledExpression[1])
+        return compiledExpression if(replacementExpression is None) else replacementExpression
+    if(compiledExpression[0]=="number"):
+        return compiledExpression
+    
+    return compiledExpression[0:2]+tuple([rpnReplaceVariables(i,getReplacement) for i in compiledExpression[2:]])
+
+
+#Creates an array of datapoints to be computed from a compiled RPN expression. columnValues associates the key of each variable in the
+#expression with the values of its column. Only rows common to all of the columns in the expression are used. Division by zero gives
+#an infinite or NaN datapoint instead of stopping the program.
+@profileStage("RPN evaluation")
+def getDataForCompiledExpression(compiledExpression,columnValues):
+    variableKeys=rpnCompiledVariables(compiledExpression)
+    commonRowCount=min([len(columnValues[i]) for i in variableKeys])
+    
+    #The columns are truncated to the rows they have in common, and are converted to float arrays without copying them if they already are.
+    variableValues={i:numpy.asarray(columnValues[i],dtype=numpy.float64)[0:commonRowCount] for i in variableKeys}
+    
+    expressionResult=rpnEvaluateCompiled(compiledExpression,variableValues)
+    return numpy.broadcast_to(expressionResult,(commonRowCount,)).astype(numpy.float64) #Ensures the result is a new column even if the expression only contains one variable.
+
+
+#Creates an array of datapoints to be computed from an RPN expression containing references to columns.
+def getDataForRpnExpression(columnData,expressionList,expressionVariables):
+    columnValues={i[0]:columnData[i[0]]["values"] for i in expressionVariables}
+    return getDataForCompiledExpression(rpnCompile(expressionList),columnValues)
\ No newline at end of file
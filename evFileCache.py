@@ -0,0 +1,380 @@
+import os
+import json
+import hashlib
+import numpy
+from concurrent.futures import ProcessPoolExecutor,ThreadPoolExecutor
+
+from settings import getSetting
+from evFileLoader import FileLoadError,loadEvFile,readEvFileHeader,getColumnTitles,readCompleteLineChunks,parseRowChunk
+
+
+cacheEnabled=getSetting("CACHE",True)
+cacheDirectory=getSetting("CACHE_DIRECTORY",os.path.join(os.path.expanduser("~"),".cache","phantomEvFilePlotter"))
+cacheMaximumBytes=getSetting("CACHE_MAXIMUM_BYTES",10*(1<<30)) #Least recently used entries are removed when the cache is larger than this.
+loadWorkerCount=getSetting("WORKERS",os.cpu_count() or 1) #The number of processes used to parse files.
+
+
+#Entries in the cache are named after a hash of the absolute path of a file followed by its size and modification time, so an
+#entry is no longer found as soon as the file it came from changes.
+def getCacheEntryName(fileName):
+    fileStatus=os.stat(fileName)
+    pathHash=hashlib.sha1(os.path.abspath(fileName).encode()).hexdigest()[0:16]
+    return pathHash+"-"+str(fileStatus.st_size)+"-"+str(fileStatus.st_mtime_ns)
+
+
+def getCacheEntryPaths(cacheEntryName):
+    entryPathStart=os.path.join(cacheDirectory,cacheEntryName)
+    return entryPathStart+".json",entryPathStart+".npy"
+
+
+#Removes the least recently used entries until the cache fits in cacheMaximumBytes, apart from the entries in protectedEntryNames (such
+#as entries that are about to be used). The modification time of an entry's metadata file is updated every time the entry is used.
+def evictCacheEntries(protectedEntryNames=()):
+    cacheEntries=[]
+    cacheSize=0
+    
+    for currentFileName in os.listdir(cacheDirectory):
+        if(currentFileName.endswith(".json")):
+            cacheEntryName=currentFileName[0:-5]
+            metadataPath,valuesPath=getCacheEntryPaths(cacheEntryName)
+            try:
+                entrySize=os.path.getsize(metadataPath)+os.path.getsize(valuesPath)
+                if(cacheEntryName not in protectedEntryNames): #Protected entries still count towards the size of the cache.
+                    cacheEntries.append((os.path.getmtime(metadataPath),entrySize,cacheEntryName))
+            except OSError: #The entry is incomplete or is being removed by another process.
+                continue
+            cacheSize+=entrySize
+    
+    cacheEntries.sort()
+    for currentEntry in cacheEntries:
+        if(cacheSize<=cacheMaximumBytes):
+            break
+        
+        removeCacheEntry(currentEntry[2])
+        cacheSize-=currentEntry[1]
+
+
+def removeCacheEntry(cacheEntryName):
+    for currentPath in getCacheEntryPaths(cacheEntryName):
+        try:
+            os.remove(currentPath)
+        except FileNotFoundError:
+            pass
+
+
+#Stores an entry in the cache made of a dictionary of metadata and an array of values, then removes the least recently used entries
+#if the cache is too large.
+def storeCacheValues(cacheEntryName,entryMetadata,entryValues):
+    os.makedirs(cacheDirectory,exist_ok=True)
+    metadataPath,valuesPath=getCacheEntryPaths(cacheEntryName)
+    
+    #The files are written under temporary names first so other processes never see a partly written entry. The metadata file
+    #is written last as its existence marks the entry as complete.
+    temporaryPathEnd=".tmp"+str(os.getpid())
+    with open(valuesPath+temporaryPathEnd,"wb") as valuesFile:
+        numpy.save(valuesFile,entryValues)
+    os.replace(valuesPath+temporaryPathEnd,valuesPath)
+    
+    storeCacheMetadata(cacheEntryName,entryMetadata)
+    evictCacheEntries()
+
+
+#Writes the metadata file of an entry whose values have already been written, which marks the entry as complete.
+def storeCacheMetadata(cacheEntryName,entryMetadata):
+    metadataPath=getCacheEntryPaths(cacheEntryName)[0]
+    temporaryPathEnd=".tmp"+str(os.getpid())
+    with open(metadataPath+temporaryPathEnd,"w") as metadataFile:
+        json.dump(entryMetadata,metadataFile)
+    os.replace(metadataPath+temporaryPathEnd,metadataPath)
+
+
+#Gets the metadata and memory mapped values of an entry in the cache, or None if the entry does not exist or is damaged.
+def loadCacheValues(cacheEntryName):
+    metadataPath,valuesPath=getCacheEntryPaths(cacheEntryName)
+    
+    try:
+        with open(metadataPath,"r") as metadataFile:
+            entryMetadata=json.load(metadataFile)
+        entryValues=numpy.load(valuesPath,mmap_mode="r")
+        os.utime(metadataPath) #Marks the entry as recently used.
+        return entryMetadata,entryValues
+    except (OSError,ValueError):
+        return None
+
+
+#Finds where the values of a column are stored if they are memory mapped from a cache entry, such as the rows of an entry made by
+#loadEvFileCached or the entries of single columns. Returns the path of the entry's values and the row of the entry holding the
+#column (or None if the entry only holds the column), or None if the values are not a whole row or column of a cache entry.
+def getCachedColumnLocation(columnValues):
+    entryValues=columnValues
+    while(isinstance(entryValues.base,numpy.ndarray)): #Views of the memory mapped array, including those made by numpy.asarray, are followed back to it.
+        entryValues=entryValues.base
+    if((not isinstance(entryValues,numpy.memmap)) or (entryValues.filename is None) or (not entryValues.filename.endswith(".npy"))):
+        return None
+    if((columnValues.ndim!=1) or (columnValues.dtype!=entryValues.dtype)):
+        return None
+    
+    valuesOffset=columnValues.ctypes.data-entryValues.ctypes.data
+    if(entryValues.ndim==1):
+        return (entryValues.filename,None) if((valuesOffset==0) and (len(columnValues)==len(entryValues))) else None
+    if((entryValues.ndim==2) and (columnValues.shape[0]==entryValues.shape[1]) and (columnValues.strides[0]==entryValues.strides[1]) and (valuesOffset%entryValues.strides[0]==0)):
+        return entryValues.filename,valuesOffset//entryValues.strides[0]
+    return None
+
+
+#Memory maps the values of a column from a cache entry found by getCachedColumnLocation.
+def loadCachedColumn(valuesPath,rowIndex):
+    entryValues=numpy.load(valuesPath,mmap_mode="r")
+    return entryValues if(rowIndex is None) else entryValues[rowIndex]
+
+
+#Removes the entries made from older versions of the file that the entry cacheEntryName (or the entries for its columns) was made from.
+def removeStaleCacheEntries(cacheEntryName):
+    os.makedirs(cacheDirectory,exist_ok=True)
+    
+    pathHash=cacheEntryName.split("-")[0]
+    for currentFileName in os.listdir(cacheDirectory):
+        if(currentFileName.startswith(pathHash+"-") and currentFileName.endswith(".json") and (not currentFileName.startswith(cacheEntryName))):
+            removeCacheEntry(currentFileName[0:-5])
+
+
+#Stores the column titles, column values and position after the last row read (see loadEvFile) of a file in the cache. Older entries
+#for the same file are removed.
+def storeCacheEntry(fileName,cacheEntryName,columnTitles,columnValues,dataEndPosition):
+    removeStaleCacheEntries(cacheEntryName)
+    storeCacheValues(cacheEntryName,{"fileName":os.path.abspath(fileName),"columnTitles":columnTitles,"dataEnd":dataEndPosition},columnValues)
+
+
+#Does the same as loadEvFile, but the result is read from the cache if the file has been read before and has not changed since.
+#Column values read from the cache are memory mapped, so only the parts of the file that are used are read from the disk. Files read
+#without their last line (see completeLinesOnly in loadEvFile) are not stored in the cache.
+def loadEvFileCached(fileName,completeLinesOnly=False):
+    if(not cacheEnabled):
+        return loadEvFile(fileName,completeLinesOnly=completeLinesOnly)
+    
+    cacheEntryName=getCacheEntryName(fileName)
+    cachedEntry=loadCacheValues(cacheEntryName)
+    if(cachedEntry is not None): #Entries made before the position was stored were made from the whole file, which has not changed since.
+        return [tuple(i) for i in cachedEntry[0]["columnTitles"]],cachedEntry[1],cachedEntry[0].get("dataEnd",os.path.getsize(fileName))
+    
+    columnTitles,columnValues,dataEndPosition=loadEvFile(fileName,completeLinesOnly=completeLinesOnly)
+    if(dataEndPosition<os.path.getsize(fileName)):
+        return columnTitles,columnValues,dataEndPosition
+    try:
+        storeCacheEntry(fileName,cacheEntryName,columnTitles,columnValues,dataEndPosition)
+    except OSError as cacheError:
+        print("The file "+fileName+" could not be stored in the cache: "+str(cacheError))
+        
+    return columnTitles,columnValues,dataEndPosition
+
+
+#Reads the column titles and number of rows of a file without parsing its rows (see readEvFileHeader), using the cache if the whole file
+#is in it. If countRows is False only the first line of the file is read and the number of rows is None unless the file is in the cache.
+#Returns the column titles and number of rows.
+def readEvFileHeaderCached(fileName,countRows=True):
+    if(cacheEnabled):
+        cachedEntry=loadCacheValues(getCacheEntryName(fileName))
+        if(cachedEntry is not None):
+            return [tuple(i) for i in cachedEntry[0]["columnTitles"]],cachedEntry[1].shape[1]
+    
+    with open(file=fileName,mode="rb") as dataFile:
+        if(not countRows):
+            return getColumnTitles(dataFile.readline().decode()),None
+        columnTitles,columnCount,rowCount,dataStartPosition=readEvFileHeader(dataFile)
+    return columnTitles,rowCount
+
+
+#Loads some of the columns (numbered from 0) of a file as arrays of valueType. Columns are taken from the cache entry of the whole file
+#if there is one, or otherwise from cache entries for single columns, so only the columns that are not in the cache are parsed. Parsed
+#columns are stored in the cache as single columns. Returns a list of arrays in the same order as columnIndices.
+def loadEvFileColumnsCached(fileName,columnIndices,valueType=numpy.float64):
+    if(not cacheEnabled):
+        return list(loadEvFile(fileName,columnIndices,valueType)[1])
+    
+    cacheEntryName=getCacheEntryName(fileName)
+    cachedEntry=loadCacheValues(cacheEntryName)
+    if(cachedEntry is not None): #Rows of the memory mapped array are used without being copied unless they need to be converted.
+        return [cachedEntry[1][i].astype(valueType,copy=False) for i in columnIndices]
+    
+    columnEntryNames=[getColumnEntryName(cacheEntryName,i,valueType) for i in columnIndices]
+    loadedColumns=[]
+    for currentEntryName in columnEntryNames:
+        cachedColumn=loadCacheValues(currentEntryName)
+        loadedColumns.append(None if(cachedColumn is None) else cachedColumn[1])
+    
+    uncachedIndices=[i for i,j in enumerate(loadedColumns) if(j is None)]
+    if(len(uncachedIndices)==0):
+        return loadedColumns
+    
+    parsedColumns=loadEvFile(fileName,[columnIndices[i] for i in uncachedIndices],valueType)[1]
+    try:
+        removeStaleCacheEntries(cacheEntryName)
+        for i,currentValues in zip(uncachedIndices,parsedColumns):
+            storeCacheValues(columnEntryNames[i],{"fileName":os.path.abspath(fileName)},currentValues)
+    except OSError as cacheError:
+        print("Columns of the file "+fileName+" could not be stored in the cache: "+str(cacheError))
+    
+    for i,currentValues in zip(uncachedIndices,parsedColumns):
+        loadedColumns[i]=currentValues
+    return loadedColumns
+
+
+def getColumnEntryName(cacheEntryName,columnIndex,valueType):
+    return cacheEntryName+"-column"+str(columnIndex)+"-"+numpy.dtype(valueType).name
+
+
+#Converts a file into a cache entry for each of its columns (see loadEvFileColumnsCached) a chunk of rows at a time, with each chunk
+#being written straight into the memory mapped entries so the whole file is never held in memory. Files that have already been converted
+#are not converted again. Returns the column titles and a list of the memory mapped values of each column.
+def convertEvFileToColumnEntries(fileName):
+    cacheEntryName=getCacheEntryName(fileName)
+    with open(file=fileName,mode="rb") as dataFile:
+        columnTitles,columnCount,rowCount,dataStartPosition=readEvFileHeader(dataFile)
+        if((rowCount==0) or (columnCount==0)):
+            raise FileLoadError("The file "+fileName+" has no rows of values.")
+        columnEntryNames=[getColumnEntryName(cacheEntryName,i,numpy.float64) for i in range(0,columnCount)]
+        
+        cachedColumns=[loadCacheValues(i) for i in columnEntryNames]
+        if(None not in cachedColumns):
+            return columnTitles,[i[1] for i in cachedColumns]
+        
+        removeStaleCacheEntries(cacheEntryName)
+        temporaryPathEnd=".tmp"+str(os.getpid())
+        valuesPaths=[getCacheEntryPaths(i)[1] for i in columnEntryNames]
+        columnFiles=[numpy.lib.format.open_memmap(i+temporaryPathEnd,mode="w+",dtype=numpy.float64,shape=(rowCount,)) for i in valuesPaths]
+        
+        dataFile.seek(dataStartPosition)
+        currentRow=0
+        for currentChunk in readCompleteLineChunks(dataFile):
+            chunkValues=parseRowChunk(currentChunk,columnCount,fileName)
+            for currentColumnFile,currentChunkValues in zip(columnFiles,chunkValues.T):
+                currentColumnFile[currentRow:currentRow+len(currentChunkValues)]=currentChunkValues
+            currentRow+=len(chunkValues)
+    
+    if(currentRow==0): #The file only has blank lines after its header.
+        for i,currentValuesPath in enumerate(valuesPaths):
+            columnFiles[i]=None
+            os.remove(currentValuesPath+temporaryPathEnd)
+        raise FileLoadError("The file "+fileName+" has no rows of values.")
+    
+    for i,currentValuesPath in enumerate(valuesPaths):
+        if(currentRow<rowCount): #Rows are overcounted if the file contains blank lines, so the column is written again without the extra rows.
+            with open(currentValuesPath,"wb") as valuesFile:
+                numpy.save(valuesFile,columnFiles[i][0:currentRow])
+            columnFiles[i]=None #The memory map is closed before its file is removed.
+            os.remove(currentValuesPath+temporaryPathEnd)
+        else:
+            columnFiles[i].flush()
+            columnFiles[i]=None
+            os.replace(currentValuesPath+temporaryPathEnd,currentValuesPath)
+        storeCacheMetadata(columnEntryNames[i],{"fileName":os.path.abspath(fileName),"columnTitles":columnTitles})
+    
+    evictCacheEntries(columnEntryNames) #The columns of the file are kept even if they are larger than the cache.
+    convertedColumns=[loadCacheValues(i) for i in columnEntryNames]
+    if(None in convertedColumns):
+        raise FileLoadError("The converted columns of the file "+fileName+" could not be read from the cache directory "+cacheDirectory+".")
+    return columnTitles,[i[1] for i in convertedColumns]
+
+
+#Runs in a worker process of loadEvFiles. If the file ends up in the cache only its column titles are sent back, as the main
+#process can memory map the values from the cache instead of receiving a copy of them.
+def loadEvFileInWorker(fileName,completeLinesOnly=False):
+    columnTitles,columnValues,dataEndPosition=loadEvFileCached(fileName,completeLinesOnly)
+    
+    if(cacheEnabled and os.path.exists(getCacheEntryPaths(getCacheEntryName(fileName))[0])):
+        return columnTitles,None,dataEndPosition
+    return columnTitles,numpy.ascontiguousarray(columnValues),dataEndPosition
+
+
+#Loads many files at once using loadWorkerCount processes. Returns a list with the result of loadEvFileCached for each file in the same
+#order as fileNames. If a file could not be loaded its place in the list holds the exception that was raised instead. completeLinesOnly is
+#used in the same way as in loadEvFile.
+def loadEvFiles(fileNames,completeLinesOnly=False):
+    workerCount=max(1,min(loadWorkerCount,len(fileNames)))
+    loadResults=[]
+    
+    if(workerCount==1):
+        for currentFileName in fileNames:
+            try:
+                loadResults.append(loadEvFileCached(currentFileName,completeLinesOnly))
+            except Exception as loadError:
+                loadResults.append(loadError)
+        return loadResults
+    
+    with ProcessPoolExecutor(max_workers=workerCount) as loadExecutor:
+        loadFutures=[loadExecutor.submit(loadEvFileInWorker,i,completeLinesOnly) for i in fileNames]
+        
+        for currentFileName,currentFuture in zip(fileNames,loadFutures):
+            try:
+                columnTitles,columnValues,dataEndPosition=currentFuture.result()
+                if(columnValues is None): #The values are read from the cache entry made by the worker process.
+                    columnTitles,columnValues,dataEndPosition=loadEvFileCached(currentFileName,completeLinesOnly)
+                loadResults.append((columnTitles,columnValues,dataEndPosition))
+            except Exception as loadError:
+                loadResults.append(loadError)
+                
+    return loadResults
+
+
+#Holds a file that is being parsed in the background by prefetchEvFiles. Its columns are loaded with loadColumns (which is used in the
+#same way as loadEvFileColumnsCached), which waits until the file has been parsed, so using a column only waits for the file it is in.
+#isParsed tells whether the file has been parsed (or has failed to be parsed), so its columns can be loaded without waiting.
+class PrefetchedEvFile:
+    def __init__(self,fileName,loadFuture):
+        self.fileName=fileName
+        self.loadFuture=loadFuture
+        self.columnValues=None
+        
+        
+    def isParsed(self):
+        return self.loadFuture.done()
+    
+    
+    def loadColumns(self,columnIndices,valueType=numpy.float64):
+        if(self.columnValues is None):
+            columnValues=self.loadFuture.result()[1] #Raises the error raised while parsing the file, if there was one.
+            if(columnValues is None): #The values are read from the cache entry made by the worker process.
+                columnValues=loadEvFileCached(self.fileName)[1]
+            self.columnValues=columnValues
+            
+        return [self.columnValues[i].astype(valueType,copy=False) for i in columnIndices]
+
+
+#Starts parsing many files in the background using loadWorkerCount processes (or a thread if there is only one worker) without waiting
+#for them to be parsed, so the column titles of the files can be shown while they are parsed. Returns a PrefetchedEvFile for each file in
+#the same order as fileNames.
+def prefetchEvFiles(fileNames):
+    workerCount=max(1,min(loadWorkerCount,len(fileNames)))
+    loadExecutor=ProcessPoolExecutor(max_workers=workerCount) if(workerCount>1) else ThreadPoolExecutor(max_workers=1)
+    prefetchedFiles=[PrefetchedEvFile(i,loadExecutor.submit(loadEvFileInWorker,i)) for i in fileNames]
+    loadExecutor.shutdown(wait=False) #The files that have been submitted are still parsed.
+    return prefetchedFiles
+
+
+#Runs in a worker process of convertEvFiles. Only the column titles are sent back as the main process memory maps the converted columns.
+def convertEvFileInWorker(fileName):
+    return convertEvFileToColumnEntries(fileName)[0]
+
+
+#Converts many files into cache entries for each of their columns at once using loadWorkerCount processes (see convertEvFileToColumnEntries).
+#Returns a list holding the column titles and memory mapped columns of each file, or the error raised if it could not be converted.
+def convertEvFiles(fileNames):
+    workerCount=max(1,min(loadWorkerCount,len(fileNames)))
+    convertResults=[]
+    
+    if(workerCount>1):
+        with ProcessPoolExecutor(max_workers=workerCount) as convertExecutor:
+            convertFutures=[convertExecutor.submit(convertEvFileInWorker,i) for i in fileNames]
+            convertErrors=[i.exception() for i in convertFutures]
+    else:
+        convertErrors=[None]*len(fileNames)
+    
+    for currentFileName,currentError in zip(fileNames,convertErrors):
+        try:
+            if(currentError is not None):
+                raise currentError
+            convertResults.append(convertEvFileToColumnEntries(currentFileName)) #Converted files are memory mapped without being converted again.
+        except Exception as convertError:
+            convertResults.append(convertError)
+    
+    return convertResults
@@ -0,0 +1,159 @@
+import os
+import numpy
+
+from evFileLoader import parseRowChunk
+from equation import getDataForRpnExpression
+from calculus import differentiateValues
+from derivedColumns import computeDerivedColumns,getRecipeInputs
+from columnStore import GrowableColumns
+from profiling import profileStage
+
+
+#Keeps the columns from a set of files up to date with rows that are appended to the files after they were opened, such as the
+#.ev files of a running simulation. Only new complete lines are read. User created columns that have a recipe (see derivedColumns) are
+#extended with rows computed from the new rows of the columns they were created from, apart from those that have not been computed yet
+#as they are computed from all of the rows when they are first used. Only the last file of a restarted run (see evFileMerger) is followed.
+class EvFileFollower:
+    def __init__(self,fileNames,columnData):
+        self.fileNames=[i if(isinstance(i,str)) else i[-1] for i in fileNames]
+        self.columnData=columnData
+        self.fileStates=[] #Holds the read position, column count, column keys and column indices for each file.
+        self.derivedColumns={} #Associates the keys of extended user created columns with their GrowableColumns.
+
+        for i,currentFileName in enumerate(self.fileNames):
+            #The keys of the columns from each file are found using the scheme used by getColumnData.
+            columnKeySuffix=chr(ord("a")+i)
+            fileColumnKeys=[j for j in columnData.keys() if((j[-1]==columnKeySuffix) and (j[0:-1].isdigit()))]
+            if(len(fileColumnKeys)==0): #The file could not be loaded.
+                self.fileStates.append(None)
+                continue
+
+            #Rows are read from where the file was read up to when it was loaded, so rows appended since then are not missed.
+            with open(file=currentFileName,mode="rb") as currentFile:
+                currentFile.readline()
+                fileColumnCount=len(currentFile.readline().split())
+                currentFile.seek(0,os.SEEK_END)
+                readPosition=columnData.fileDataEnds.get(currentFileName,currentFile.tell())
+                currentFile.seek(max(0,readPosition-65536))
+                fileEnd=currentFile.read(readPosition-currentFile.tell())
+
+            fileColumnValues=numpy.array([columnData[j]["values"] for j in fileColumnKeys])
+            #Files are loaded without a last line that is still being written (see loadEvFile), apart from files taken from the cache that had
+            #such a line when they were stored. The line is removed and read again once it is complete.
+            if((len(fileEnd)>0) and (not fileEnd.endswith(b"\n"))):
+                readPosition-=len(fileEnd)-(fileEnd.rfind(b"\n")+1)
+                fileColumnValues=fileColumnValues[:,0:-1]
+
+            fileColumns=GrowableColumns(fileColumnValues)
+            fileColumnIndices=[int(j[0:-1])-1 for j in fileColumnKeys]
+            self.fileStates.append({"readPosition":readPosition,"columnCount":fileColumnCount,"columnKeys":fileColumnKeys,
+                                    "columnIndices":fileColumnIndices,"columns":fileColumns})
+            self.updateColumnValues(fileColumns,fileColumnKeys,fileColumns.rowCount)
+
+
+    #Gives columns the values of their GrowableColumns, of which the first keptRowCount rows have not changed since they were last given.
+    def updateColumnValues(self,growableColumns,columnKeys,keptRowCount=0):
+        for j,currentKey in enumerate(columnKeys):
+            self.columnData.setGrownValues(currentKey,growableColumns.getValues(j),keptRowCount)
+
+
+    #Reads the complete lines appended to a file since it was last read. Returns the number of rows added.
+    def readNewRows(self,fileName,fileState):
+        with open(file=fileName,mode="rb") as currentFile:
+            currentFile.seek(0,os.SEEK_END)
+            if(currentFile.tell()<=fileState["readPosition"]): #Nothing new has been written.
+                return 0
+
+            currentFile.seek(fileState["readPosition"])
+            newBytes=currentFile.read()
+
+        newBytes=newBytes[0:newBytes.rfind(b"\n")+1] #Only complete lines are read.
+        if(len(newBytes)==0):
+            return 0
+
+        newRows=parseRowChunk(newBytes,fileState["columnCount"],fileName)
+        oldRowCount=fileState["columns"].rowCount
+        fileState["columns"].append(newRows[:,fileState["columnIndices"]].T)
+        fileState["readPosition"]+=len(newBytes)
+        self.updateColumnValues(fileState["columns"],fileState["columnKeys"],oldRowCount)
+        return len(newRows)
+
+
+    #Computes the values to be added to the end of a user created column from its recipe. Returns the number of values at the end of
+    #the column that are replaced along with the new values, or None if the column cannot be extended.
+    def getNewDerivedValues(self,columnKey):
+        recipe=self.columnData[columnKey].get("recipe")
+        if(recipe is None):
+            return None
+
+        operation=recipe[0]
+        currentValues=self.columnData[columnKey]["values"]
+        if((operation=="g") or ((operation=="e") and (len(recipe)>3))): #New rows can change every row of a grid, so these are computed again.
+            recomputedColumn=computeDerivedColumns(self.columnData,[recipe])[0]
+            return None if(recomputedColumn is None) else (len(currentValues),recomputedColumn[0])
+
+        if(operation not in ["e","i","d"]): #Linear columns, polynomial fits and windows are not extended.
+            return None
+        
+        oldRowCount=len(currentValues)
+
+        if(operation=="e"):
+            expressionList,expressionVariables=recipe[1:3]
+            newColumnData={i[0]:{"values":self.columnData[i[0]]["values"][oldRowCount:]} for i in expressionVariables}
+            if(min([len(i["values"]) for i in newColumnData.values()])==0):
+                return None
+            return 0,getDataForRpnExpression(newColumnData,list(expressionList),expressionVariables)
+
+        xValues=self.columnData[recipe[1]]["values"]
+        yValues=self.columnData[recipe[2]]["values"]
+        newRowCount=min(len(xValues),len(yValues))
+        if((newRowCount<=oldRowCount) or (oldRowCount==0)):
+            return None
+
+        if(operation=="i"): #The integral is continued from its last value.
+            xDifferences=numpy.diff(xValues[oldRowCount-1:newRowCount])
+            ySums=yValues[oldRowCount-1:newRowCount-1]+yValues[oldRowCount:newRowCount]
+            return 0,currentValues[-1]+numpy.cumsum(0.5*xDifferences*ySums)
+
+        if(operation=="d"): #The last averageRadius values were computed with clamped indices, so they are computed again.
+            averageRadius=recipe[3]
+            replacedRowCount=min(oldRowCount,averageRadius)
+            return replacedRowCount,differentiateValues(xValues[0:newRowCount],yValues[0:newRowCount],averageRadius,oldRowCount-replacedRowCount)
+
+        return None
+
+
+    #Reads new rows from all of the files and extends the user created columns. Only user created columns made from columns that have
+    #changed are extended, so grids and aligned expressions (which are computed again in full) are only computed again when the columns
+    #they are made from have new rows. Returns True if any columns have changed.
+    @profileStage("file following")
+    def poll(self):
+        changedKeys=set()
+
+        for currentFileName,currentFileState in zip(self.fileNames,self.fileStates):
+            if((currentFileState is not None) and (self.readNewRows(currentFileName,currentFileState)>0)):
+                changedKeys.update(currentFileState["columnKeys"])
+
+        if(len(changedKeys)==0):
+            return False
+
+        for currentKey in list(self.columnData.keys()): #User created columns come after the columns they were created from.
+            if(("recipe" not in self.columnData[currentKey]) or (not self.columnData.isMaterialized(currentKey))):
+                continue
+            if(changedKeys.isdisjoint(getRecipeInputs(self.columnData[currentKey]["recipe"]))):
+                continue
+
+            if(currentKey not in self.derivedColumns):
+                self.derivedColumns[currentKey]=GrowableColumns([self.columnData[currentKey]["values"]])
+
+            derivedColumn=self.derivedColumns[currentKey]
+            newDerivedValues=self.getNewDerivedValues(currentKey)
+            if(newDerivedValues is not None):
+                replacedRowCount,newValues=newDerivedValues
+                derivedColumn.rowCount-=replacedRowCount
+                keptRowCount=derivedColumn.rowCount
+                derivedColumn.append(numpy.asarray(newValues).reshape((1,-1)))
+                self.updateColumnValues(derivedColumn,[currentKey],keptRowCount)
+                changedKeys.add(currentKey)
+
+        return True
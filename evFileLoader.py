@@ -0,0 +1,127 @@
+import io
+import numpy
+
+from profiling import profileStage
+
+
+evFileChunkSize=1<<20 #The number of bytes of a file that are parsed at once.
+
+
+#Raised when a file cannot be loaded, such as when it has no rows of values. It is also raised by ColumnStore when the columns of a file
+#cannot be loaded the first time they are used.
+class FileLoadError(Exception):
+    pass
+
+
+#Gets the column numbers and names from the first line of a file. Returns a list of tuples containing the column number (as a
+#string) and the column name.
+@profileStage("header parsing")
+def getColumnTitles(firstLine):
+    import regex #Only imported when a file is first loaded, so the program starts faster.
+    columnTitles=[]
+
+    foundColumnTitles=regex.findall("(?<=\[)([^\[]{1,})(?=\])",firstLine) #All substrings of the first line in the file with a length of at least 1 character between a [ and a ] and not containing a [ are found.
+    for j in foundColumnTitles: #Loops through all found column titles (column numbers and their names).
+        columnNumber=regex.search("(?<=^)( *)([0-9]+)",j) #Gets a sequence of numbers following the start of the string and possibly some spaces.
+        columnName=regex.search("(?<=^)( *[0-9]+ *)(.+)",j) #Gets the substring following the start of the string, possibly some spaces, a number and possibly some spaces.
+        columnTitles.append((columnNumber.group(2),columnName.group(2)))
+
+    return columnTitles
+
+
+#Yields chunks of a binary file starting from its current position, up to endPosition if it is given or otherwise to the end of the file.
+#Every chunk apart from possibly the last one ends with a new line so rows are never split between chunks.
+def readCompleteLineChunks(dataFile,chunkSize=evFileChunkSize,endPosition=None):
+    leftoverBytes=b""
+
+    while(True):
+        currentChunk=dataFile.read(chunkSize if(endPosition is None) else max(0,min(chunkSize,endPosition-dataFile.tell())))
+        if(len(currentChunk)==0):
+            if(len(leftoverBytes)!=0):
+                yield leftoverBytes
+            return
+
+        lastNewLineIndex=currentChunk.rfind(b"\n")
+        if(lastNewLineIndex==-1): #The chunk is part of a very long line.
+            leftoverBytes+=currentChunk
+            continue
+
+        yield leftoverBytes+currentChunk[0:lastNewLineIndex+1]
+        leftoverBytes=currentChunk[lastNewLineIndex+1:]
+
+
+#Parses a chunk of rows into an array with a row of values for each row of the chunk. If columnIndices is given only those columns are
+#converted to values of valueType, which is faster than converting every column.
+@profileStage("row parsing")
+def parseRowChunk(chunk,columnCount,fileName,columnIndices=None,valueType=numpy.float64):
+    if(len(chunk.strip())==0): #A chunk of blank lines has no rows.
+        return numpy.empty((0,columnCount if(columnIndices is None) else len(columnIndices)),dtype=valueType)
+    try:
+        chunkValues=numpy.loadtxt(io.BytesIO(chunk),dtype=valueType,comments=None,ndmin=2,usecols=columnIndices)
+    except (ValueError,IndexError) as parseError:
+        raise ValueError("The file "+fileName+" contains data that cannot be read: "+str(parseError))
+
+    if((columnIndices is None) and (chunkValues.shape[1]!=columnCount)):
+        raise ValueError("The file "+fileName+" has rows with differing numbers of columns.")
+
+    return chunkValues
+
+
+#Reads the first line of a file and counts its rows without parsing them. Returns the column titles (see getColumnTitles), the number
+#of columns, the number of rows (which is too large if the file contains blank lines) and the position in the file where the rows start.
+def readEvFileHeader(dataFile):
+    firstLine=dataFile.readline().decode()
+    dataStartPosition=dataFile.tell()
+    columnCount=len(dataFile.readline().split())
+
+    dataFile.seek(dataStartPosition)
+    rowCount=0
+    lastChunk=b"\n"
+    for currentChunk in readCompleteLineChunks(dataFile):
+        rowCount+=currentChunk.count(b"\n")
+        lastChunk=currentChunk
+        
+    if(not lastChunk.endswith(b"\n")): #The last row does not end with a new line.
+        rowCount+=1
+    return getColumnTitles(firstLine),columnCount,rowCount,dataStartPosition
+
+
+#Gets the position after the last new line of a file between startPosition and endPosition, or startPosition if there is none. The file
+#is read backwards from endPosition, so only the end of the file is read.
+def findLastLineEnd(dataFile,startPosition,endPosition):
+    blockEnd=endPosition
+    while(blockEnd>startPosition):
+        blockStart=max(startPosition,blockEnd-65536)
+        dataFile.seek(blockStart)
+        lastNewLineIndex=dataFile.read(blockEnd-blockStart).rfind(b"\n")
+        if(lastNewLineIndex!=-1):
+            return blockStart+lastNewLineIndex+1
+        blockEnd=blockStart
+
+    return startPosition
+
+
+#Reads a file into a contiguous array for each column. The first line of the file contains the column titles, with the following lines
+#containing values separated by spaces. Returns the column titles (see getColumnTitles), an array with a row for each column of the file
+#(or only for the columns numbered from 0 in columnIndices if it is given) and the position in the file after the last row that was read,
+#from which rows appended later can be read (see EvFileFollower). The values are stored as valueType. If completeLinesOnly is True a last
+#line without a new line at its end is not read, as it may be a row that is still being written, such as for a file that is followed.
+def loadEvFile(fileName,columnIndices=None,valueType=numpy.float64,completeLinesOnly=False):
+    with open(file=fileName,mode="rb") as dataFile:
+        columnTitles,columnCount,rowCount,dataStartPosition=readEvFileHeader(dataFile) #The number of rows is counted first so the column arrays can be created at their final size.
+        dataEndPosition=dataFile.tell() #Rows appended after they were counted are not read, so there are never more rows than were counted.
+        if(completeLinesOnly):
+            dataEndPosition=findLastLineEnd(dataFile,dataStartPosition,dataEndPosition)
+        loadedColumnCount=columnCount if(columnIndices is None) else len(columnIndices)
+        columnValues=numpy.empty((loadedColumnCount,rowCount),dtype=valueType)
+
+        dataFile.seek(dataStartPosition)
+        currentRow=0
+        for currentChunk in readCompleteLineChunks(dataFile,endPosition=dataEndPosition):
+            chunkValues=parseRowChunk(currentChunk,columnCount,fileName,columnIndices,valueType)
+            columnValues[:,currentRow:currentRow+len(chunkValues)]=chunkValues.T
+            currentRow+=len(chunkValues)
+
+    if(currentRow==0):
+        raise FileLoadError("The file "+fileName+" has no rows of values.")
+    return columnTitles,columnValues[:,0:currentRow],dataEndPosition #Rows are overcounted if the file contains blank lines.
@@ -0,0 +1,142 @@
+import os
+import hashlib
+import numpy
+
+from evFileLoader import FileLoadError,readEvFileHeader,findLastLineEnd,readCompleteLineChunks,parseRowChunk
+import evFileCache
+
+
+#A simulation restarted from a dump writes a new .ev file starting at the time of the dump, so the rows of earlier files from that time
+#onwards are superseded by the later file. The files of such a run are joined into one set of columns by keeping the rows of each file
+#that come before the start of every later file, then merging the rows of the files in order of time. Files are in restart order (the
+#order they are given in) and have the same columns, with the time in the column timeColumnIndex (numbered from 0).
+
+
+#Yields the rows of a file up to dataEndPosition in chunks, each as an array with a row for each row of the file.
+def readRowChunks(fileName,columnCount,dataStartPosition,dataEndPosition):
+    with open(file=fileName,mode="rb") as dataFile:
+        dataFile.seek(dataStartPosition)
+        for currentChunk in readCompleteLineChunks(dataFile,endPosition=dataEndPosition):
+            yield parseRowChunk(currentChunk,columnCount,fileName)
+
+
+#Reads the header of each file and the time of its first row without parsing the rest of the file. Returns the column titles, number of
+#columns, number of rows, position of the first row, time of the first row (infinite if the file has no rows) and position after the last
+#counted row of each file. Rows appended to a file after they were counted are not read. If completeLinesOnly is True a last line of the
+#last file without a new line at its end is not read (see loadEvFile).
+def readRunHeaders(fileNames,timeColumnIndex,completeLinesOnly=False):
+    runHeaders=[]
+    for i,currentFileName in enumerate(fileNames):
+        with open(file=currentFileName,mode="rb") as dataFile:
+            columnTitles,columnCount,rowCount,dataStartPosition=readEvFileHeader(dataFile)
+            dataEndPosition=dataFile.tell()
+            if(completeLinesOnly and (i==len(fileNames)-1)): #Only the last file of a run is still being written.
+                dataEndPosition=findLastLineEnd(dataFile,dataStartPosition,dataEndPosition)
+            dataFile.seek(dataStartPosition)
+            firstRow=dataFile.readline().split()
+
+        startTime=float(firstRow[timeColumnIndex]) if(len(firstRow)>timeColumnIndex) else numpy.inf
+        runHeaders.append((columnTitles,columnCount,rowCount,dataStartPosition,startTime,dataEndPosition))
+
+    return runHeaders
+
+
+#Gets the time from which the rows of each file are superseded by a later file, which is the earliest start time of the later files.
+def getSupersededTimes(startTimes):
+    supersededTimes=[numpy.inf]*len(startTimes)
+    for i in range(len(startTimes)-2,-1,-1):
+        supersededTimes[i]=min(supersededTimes[i+1],startTimes[i+1])
+
+    return supersededTimes
+
+
+#Joins the files of a restarted run. Each file is read a chunk at a time and the chunks are merged as they are read, so only one chunk of
+#each file is held in memory along with the merged columns. Runs of consecutive rows are taken from one file at a time, so the merge takes
+#linear time. Returns the column titles of the first file, an array with a row for each column and the position after the last row read
+#from the last file, from which rows appended to the run can be read (see EvFileFollower). completeLinesOnly is used in the same way as in
+#readRunHeaders.
+def mergeRestartedEvFiles(fileNames,timeColumnIndex=0,completeLinesOnly=False):
+    runHeaders=readRunHeaders(fileNames,timeColumnIndex,completeLinesOnly)
+    columnCounts=[i[1] for i in runHeaders if(i[1]>0)] #Files without rows (such as a restart that has only just begun) have no columns.
+    if(len(columnCounts)==0):
+        raise FileLoadError("The files "+", ".join(fileNames)+" have no rows of values.")
+    columnCount=columnCounts[0]
+    if(any([i!=columnCount for i in columnCounts])):
+        raise ValueError("The files "+", ".join(fileNames)+" do not all have the same number of columns, so they cannot be joined.")
+
+    supersededTimes=getSupersededTimes([i[4] for i in runHeaders])
+    mergedValues=numpy.empty((columnCount,sum([i[2] for i in runHeaders])))
+    mergedRowCount=0
+
+    #Each file has a chunk iterator along with its current chunk (with superseded rows removed) and the position of the next row in the chunk.
+    fileChunks=[readRowChunks(i,columnCount,j[3],j[5]) if(j[1]>0) else iter([]) for i,j in zip(fileNames,runHeaders)]
+    currentChunks=[None]*len(fileNames)
+    chunkPositions=[0]*len(fileNames)
+
+    def advanceChunk(fileIndex): #Gets the next chunk of a file that has rows that are not superseded, or None if there are none left.
+        for currentChunk in fileChunks[fileIndex]:
+            keptChunk=currentChunk[currentChunk[:,timeColumnIndex]<supersededTimes[fileIndex]]
+            if(len(keptChunk)>0):
+                return keptChunk
+        return None
+
+    for i in range(0,len(fileNames)):
+        currentChunks[i]=advanceChunk(i)
+
+    while(True):
+        #The file with the earliest next row (the earliest file in restart order if there is a tie) gives rows until its rows come after
+        #the next row of another file.
+        nextRows=sorted([(currentChunks[i][chunkPositions[i],timeColumnIndex],i) for i in range(0,len(fileNames)) if(currentChunks[i] is not None)])
+        if(len(nextRows)==0):
+            break
+
+        fileIndex=nextRows[0][1]
+        chunkTimes=currentChunks[fileIndex][chunkPositions[fileIndex]:,timeColumnIndex]
+        if(len(nextRows)>1):
+            limitTime,limitFileIndex=nextRows[1]
+            exceedsLimit=(chunkTimes>limitTime) if(fileIndex<limitFileIndex) else (chunkTimes>=limitTime)
+            takenRowCount=int(numpy.argmax(exceedsLimit)) if(exceedsLimit.any()) else len(chunkTimes)
+        else:
+            takenRowCount=len(chunkTimes)
+
+        startPosition=chunkPositions[fileIndex]
+        mergedValues[:,mergedRowCount:mergedRowCount+takenRowCount]=currentChunks[fileIndex][startPosition:startPosition+takenRowCount].T
+        mergedRowCount+=takenRowCount
+        chunkPositions[fileIndex]+=takenRowCount
+
+        if(chunkPositions[fileIndex]==len(currentChunks[fileIndex])):
+            currentChunks[fileIndex]=advanceChunk(fileIndex)
+            chunkPositions[fileIndex]=0
+
+    if(mergedRowCount==0):
+        raise FileLoadError("The files "+", ".join(fileNames)+" have no rows of values.")
+    return runHeaders[0][0],mergedValues[:,0:mergedRowCount],runHeaders[-1][5]
+
+
+#Gets a name for the cache entry of a joined run that changes whenever any of its files change.
+def getMergedEntryName(fileNames,timeColumnIndex=0):
+    entryNames=[evFileCache.getCacheEntryName(i) for i in fileNames]
+    return "merged-"+hashlib.sha1((str(timeColumnIndex)+"|"+"|".join(entryNames)).encode()).hexdigest()
+
+
+#Does the same as mergeRestartedEvFiles, but the joined columns are read from the cache if the files have been joined before and have
+#not changed since. Runs read without the last line of their last file are not stored in the cache.
+def mergeRestartedEvFilesCached(fileNames,timeColumnIndex=0,completeLinesOnly=False):
+    if(not evFileCache.cacheEnabled):
+        return mergeRestartedEvFiles(fileNames,timeColumnIndex,completeLinesOnly)
+
+    mergedEntryName=getMergedEntryName(fileNames,timeColumnIndex)
+    cachedEntry=evFileCache.loadCacheValues(mergedEntryName)
+    if(cachedEntry is not None): #Entries made before the position was stored were made from the whole of each file.
+        return [tuple(i) for i in cachedEntry[0]["columnTitles"]],cachedEntry[1],cachedEntry[0].get("dataEnd",os.path.getsize(fileNames[-1]))
+
+    columnTitles,mergedValues,dataEndPosition=mergeRestartedEvFiles(fileNames,timeColumnIndex,completeLinesOnly)
+    if(dataEndPosition<os.path.getsize(fileNames[-1])):
+        return columnTitles,mergedValues,dataEndPosition
+    try:
+        evFileCache.storeCacheValues(mergedEntryName,{"fileNames":[os.path.abspath(i) for i in fileNames],"columnTitles":columnTitles,
+                                                      "dataEnd":dataEndPosition},mergedValues)
+    except OSError as cacheError:
+        print("The joined files "+", ".join(fileNames)+" could not be stored in the cache: "+str(cacheError))
+
+    return columnTitles,mergedValues,dataEndPosition
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import numpy
+
+from settings import getSetting
+from equation import rpnCompiledVariables,rpnEvaluateCompiled
+import evFileCache
+
+
+outOfCoreEnabled=getSetting("OUT_OF_CORE",False) #If True files are converted into memory mapped columns on the disk and columns are computed in chunks.
+outOfCoreChunkRows=getSetting("OUT_OF_CORE_CHUNK_ROWS",1<<20) #The number of rows of a column processed at once in out of core mode.
+
+
+#In out of core mode the columns of files are memory mapped from the cache (see convertEvFileToColumnEntries), and user created columns
+#and scaled columns are computed a chunk of rows at a time into memory mapped temporary files, so the memory used does not depend on the
+#size of the files. The results are the same as those of the functions that compute whole columns at once.
+
+
+def getChunkRanges(rowCount,chunkRows=None):
+    chunkRows=outOfCoreChunkRows if(chunkRows is None) else chunkRows
+    return [(i,min(rowCount,i+chunkRows)) for i in range(0,rowCount,chunkRows)]
+
+
+#Creates a column of 64 bit floats memory mapped from a temporary file in the cache directory. The file is removed once the column is no
+#longer used.
+def createTemporaryColumn(rowCount):
+    os.makedirs(evFileCache.cacheDirectory,exist_ok=True)
+    with tempfile.TemporaryFile(dir=evFileCache.cacheDirectory) as columnFile:
+        return numpy.memmap(columnFile,dtype=numpy.float64,mode="w+",shape=(max(rowCount,1),))[0:rowCount]
+
+
+#Does the same as integrateColumns for a single column. Each chunk is continued from the last value of the previous chunk, adding
+#it to the first value of the chunk so the values are identical to those of integrateColumns.
+def integrateColumnChunked(xValues,yValues,constantOfIntegration):
+    integralValues=createTemporaryColumn(len(xValues))
+    previousSum=0.0
+
+    for chunkStart,chunkEnd in getChunkRanges(len(xValues)):
+        previousStart=max(0,chunkStart-1) #The previous x and y values are equal to the current x and y values for the first element of the integral.
+        xChunk=numpy.asarray(xValues[previousStart:chunkEnd],dtype=numpy.float64)
+        yChunk=numpy.asarray(yValues[previousStart:chunkEnd],dtype=numpy.float64)
+        if(chunkStart==0):
+            xChunk=numpy.concatenate((xChunk[0:1],xChunk))
+            yChunk=numpy.concatenate((yChunk[0:1],yChunk))
+
+        chunkTerms=0.5*(xChunk[1:]-xChunk[0:-1])*(yChunk[1:]+yChunk[0:-1])
+        chunkTerms[0]+=previousSum
+        chunkSums=numpy.cumsum(chunkTerms)
+        previousSum=chunkSums[-1]
+        integralValues[chunkStart:chunkEnd]=chunkSums+constantOfIntegration
+
+    return integralValues
+
+
+#Does the same as differentiateColumns for a single column, reading averageRadius extra rows on each side of every chunk.
+def differentiateColumnChunked(xValues,yValues,averageRadius):
+    rowCount=len(xValues)
+    derivativeValues=createTemporaryColumn(rowCount)
+
+    for chunkStart,chunkEnd in getChunkRanges(rowCount):
+        readStart=max(0,chunkStart-averageRadius)
+        readEnd=min(rowCount,chunkEnd+averageRadius)
+        xChunk=numpy.asarray(xValues[readStart:readEnd],dtype=numpy.float64)
+        yChunk=numpy.asarray(yValues[readStart:readEnd],dtype=numpy.float64)
+
+        rowIndices=numpy.arange(chunkStart,chunkEnd)
+        leftIndices=numpy.maximum(0,rowIndices-averageRadius)-readStart
+        rightIndices=numpy.minimum(rowCount-1,rowIndices+averageRadius)-readStart
+        with numpy.errstate(divide="ignore",invalid="ignore"):
+            derivativeValues[chunkStart:chunkEnd]=(yChunk[rightIndices]-yChunk[leftIndices])/(xChunk[rightIndices]-xChunk[leftIndices])
+
+    return derivativeValues
+
+
+#Does the same as getDataForCompiledExpression, evaluating the expression a chunk of rows at a time.
+def evaluateCompiledExpressionChunked(compiledExpression,columnValues):
+    variableKeys=rpnCompiledVariables(compiledExpression)
+    commonRowCount=min([len(columnValues[i]) for i in variableKeys])
+    expressionValues=createTemporaryColumn(commonRowCount)
+
+    for chunkStart,chunkEnd in getChunkRanges(commonRowCount):
+        variableValues={i:numpy.asarray(columnValues[i][chunkStart:chunkEnd],dtype=numpy.float64) for i in variableKeys}
+        expressionValues[chunkStart:chunkEnd]=rpnEvaluateCompiled(compiledExpression,variableValues)
+
+    return expressionValues
+
+
+#Multiplies a column by a scale factor a chunk of rows at a time. The values are multiplied as 64 bit floats, as unit conversion factors
+#(such as for energies) can make 32 bit floats overflow.
+def scaleColumnChunked(columnValues,scaleFactor):
+    scaledValues=createTemporaryColumn(len(columnValues))
+    for chunkStart,chunkEnd in getChunkRanges(len(columnValues)):
+        scaledValues[chunkStart:chunkEnd]=numpy.multiply(columnValues[chunkStart:chunkEnd],scaleFactor,dtype=numpy.float64)
+
+    return scaledValues
@@ -1,114 +1,155 @@
-from collections import OrderedDict
+import os
 import glob
-from braceexpand import braceexpand
-import csv
-import regex
-import matplotlib
-matplotlib.use("Qt5Agg")
-import matplotlib.pyplot as plt
-from numpy.polynomial.polynomial import polyfit
-from numpy.polynomial.polynomial import polyval
-
-from equation import getValidRpnExpression,getDataForRpnExpression
-from controls import createControls
-
-
-#Integrates yValues over xValues while adding a constant of integration to the output values.
-def integrateValues(xValues,yValues,constantOfIntegration):
-    if(len(xValues)!=len(yValues)):
-        print("Lengths of lists do not match.")
-        return None
-       
-    integralValues=[]
-    currentIntegralValue=0.0
-    
-    for i in range(len(xValues)):
-        currentXValue=xValues[i]
-        currentYValue=yValues[i]
-        previousXValue=xValues[max(0,i-1)] #The previous x and y values are equal to the current x and y values if the first
-        previousYValue=yValues[max(0,i-1)] #element of the integral is being evaluated.
-        
-        currentIntegralValue+=(0.5*(currentXValue-previousXValue)*(currentYValue+previousYValue)) #Uses the area of a trapezium.
-        integralValues.append(currentIntegralValue+constantOfIntegration)
-        
-    return integralValues
-        
-
-
-#Differentiates a list of values with respect to an equally sized other list of values. The derivative is sampled between
-#two points averageRadius away from the central point.
-def differentiateValues(xValues,yValues,averageRadius):
-    if(len(xValues)!=len(yValues)):
-        print("Lengths of lists do not match.")
-        return None
-    
-    derivativeValues=[]
+import functools
+import numpy
+
+from equation import getValidRpnExpression
+from derivedColumns import derivedColumnCache
+from polynomialFitting import getSortedWindows
+from columnAlignment import alignmentModes
+from evFileCache import loadEvFiles,prefetchEvFiles,convertEvFiles,getCacheEntryName,readEvFileHeaderCached,loadEvFileColumnsCached
+from evFileFollower import EvFileFollower
+from evFileMerger import mergeRestartedEvFilesCached,getMergedEntryName
+from decimation import DecimatedLine
+from curveCollection import collectionCurveCount,createCurveCollection,addCurveCollection,updateCollectionLimits
+import outOfCore
+from columnStore import ColumnStore,ColumnRecord,FileLoadError
+from settings import getSetting
+from profiling import profileStage,profileCanvasDrawing
+#matplotlib, regex and braceexpand are only imported by the functions that use them, so the first prompt is shown without waiting for them.
+
+
+#Gets the paths of the files matched by a file path containing globbing and brace expansion.
+def expandFilePath(filePath):
+    from braceexpand import braceexpand
+    fileNames=[]
     
-    for i in range(len(xValues)):
-        #The min and max functions are used to ensure that indices outside of the list are not used.
-        leftIndex=max(0,i-averageRadius)
-        rightIndex=min(len(xValues)-1,i+averageRadius)
-                        
-        currentDerivativeValue=(yValues[rightIndex]-yValues[leftIndex])/(xValues[rightIndex]-xValues[leftIndex])
-        derivativeValues.append(currentDerivativeValue)
-        
-    return derivativeValues
-
-
-
+    beFilePaths=list(braceexpand(filePath))
+    for currentBeFilePath in beFilePaths: #Loops over brace expanded file paths.
+        for currentGlobFilePath in glob.glob(currentBeFilePath): #Loops over the globbing matches for each brace expanded file path.
+            fileNames.append(currentGlobFilePath)
+            
+    return fileNames
 
 
-#Allows the user to select what files they want to open.
+#Allows the user to select what files they want to open. The files of a simulation restarted from dumps can be joined into one run,
+#which is given as a tuple of file names in restart order (see evFileMerger).
 def openFiles():
     fileNames=[]
+    runFileNames=[] #The files chosen since the files were last joined into a run.
     
     while(True):
-        print("Type the path of a file to open. You can use globbing and brace expansion. Use forward path slashes. Enter f if finished selecting files.")
+        print("Type the path of a file to open. You can use globbing and brace expansion. Use forward path slashes. Enter m to join the files chosen since the last m into one run (for a simulation restarted from dumps). Enter f if finished selecting files.")
         filePath=input()
         
         if(filePath=="f"): #The user has finished selecting the files to be opened.
-            fileNames.sort() #Sorts the filenames in Unicode code point order.
-            openedFiles=[open(file=i,mode="r") for i in fileNames]
+            fileNames.extend(runFileNames)
+            fileNames.sort(key=lambda i:i if(isinstance(i,str)) else i[0]) #Sorts the filenames in Unicode code point order, with runs sorted by their first file.
+            openedFiles=[open(file=j,mode="r") for i in fileNames for j in ([i] if(isinstance(i,str)) else i)]
             return fileNames,openedFiles
-
-        beFilePaths=list(braceexpand(filePath))
-        for currentBeFilePath in beFilePaths: #Loops over brace expanded file paths.
-            for currentGlobFilePath in glob.glob(currentBeFilePath): #Loops over the globbing matches for each brace expanded file path.
-                fileNames.append(currentGlobFilePath)
+        
+        if(filePath=="m"):
+            if(len(runFileNames)>1):
+                fileNames.append(tuple(sorted(runFileNames))) #The files of a run are assumed to be named in restart order.
+                print("The files "+", ".join(sorted(runFileNames))+" will be joined into one run.")
+            else:
+                print("At least two files need to be chosen to join them into a run.")
+                fileNames.extend(runFileNames)
+            runFileNames=[]
+            continue
+
+        runFileNames.extend(expandFilePath(filePath))
+
+
+#Reads the column titles and number of rows of each file (see readEvFileHeaderCached). Returns a list holding the column titles and number
+#of rows for each file, or the error raised if the file could not be read.
+def readEvFileHeaders(fileNames,countRows=True):
+    headerResults=[]
+    for currentFileName in fileNames:
+        try:
+            headerResults.append(readEvFileHeaderCached(currentFileName,countRows))
+        except Exception as headerError:
+            headerResults.append(headerError)
+            
+    return headerResults
 
 
 #Associates column names, column data and the file they came from with a key that allows the selection of columns to plot in getColumnPairsToPlot.
-def getColumnData(fileNames,openedFiles):
-    columnData=OrderedDict() #An ordered dictionary that associates a key to information (also a dictionary) about each column. As the ordered dictionary
-    #iterates items the order they are added to the dictionary and that columns from the same file are added to the dictionary together (as seen below), columns
-    #are grouped together based on what file they came from making information about the columns easier to read in getColumnPairsToPlot.
-    
-    for i,cfnCf in enumerate(zip(fileNames,openedFiles)):
-        currentFileName=cfnCf[0]
-        currentFile=cfnCf[1]
+#If selectiveLoading is True only the column titles are read, and each column is loaded the first time it is used (see
+#ColumnStore.addUnloadedFileColumns). If prefetchFiles is True (and selectiveLoading is not) only the column titles are read before returning,
+#with the files being parsed in the background (see prefetchEvFiles) and a column waiting for its file to be parsed the first time it is used.
+#If float32Values is True the values of the columns are stored as 32 bit floats, using half of the memory. If followFiles is True the
+#files are going to be followed (see EvFileFollower), so a last line that is still being written is not read. In out of core mode the files are
+#converted into memory mapped columns on the disk instead (see outOfCore), and none of these options are used.
+#Entries of fileNames that are tuples of file names are restarted runs, which are joined into one set of columns (see evFileMerger).
+@profileStage("file loading")
+def getColumnData(fileNames,openedFiles=(),selectiveLoading=False,float32Values=False,prefetchFiles=False,followFiles=False):
+    columnData=ColumnStore() #Associates a key to information (a ColumnRecord) about each column. As the column store iterates items in the order they
+    #are added to it and that columns from the same file are added to it together (as seen below), columns are grouped together based on what file they
+    #came from making information about the columns easier to read in getColumnPairsToPlot.
+    
+    for currentFile in openedFiles:
+        currentFile.close() #The files are read again in binary mode by loadEvFile, or not at all if they are in the cache.
+    
+    valueType=numpy.float32 if(float32Values) else numpy.float64
+    prefetchFiles=prefetchFiles and (not selectiveLoading)
+    prefetchedFiles={} #Associates the name of each file being parsed in the background with its PrefetchedEvFile.
+    singleFileIndices=[i for i,j in enumerate(fileNames) if(isinstance(j,str))]
+    singleFileNames=[fileNames[i] for i in singleFileIndices]
+    if(outOfCore.outOfCoreEnabled):
+        singleLoadResults=convertEvFiles(singleFileNames)
+        selectiveLoading=False
+        prefetchFiles=False
+        valueType=numpy.float64
+    elif(selectiveLoading or prefetchFiles):
+        singleLoadResults=readEvFileHeaders(singleFileNames,countRows=selectiveLoading) #Prefetched files are counted while they are parsed.
+        if(prefetchFiles): #Files whose headers could not be read are not parsed.
+            readFileNames=[i for i,j in zip(singleFileNames,singleLoadResults) if(not isinstance(j,Exception))]
+            prefetchedFiles=dict(zip(readFileNames,prefetchEvFiles(readFileNames)))
+    else:
+        singleLoadResults=loadEvFiles(singleFileNames,followFiles) #The files are parsed at the same time in separate processes.
+    
+    loadResults=[None]*len(fileNames)
+    for i,currentLoadResult in zip(singleFileIndices,singleLoadResults):
+        loadResults[i]=currentLoadResult
+    for i,currentFileNames in enumerate(fileNames):
+        if(not isinstance(currentFileNames,str)): #The files of a restarted run are always loaded completely, while any prefetched files are parsed.
+            try:
+                loadResults[i]=mergeRestartedEvFilesCached(list(currentFileNames),completeLinesOnly=followFiles)
+            except Exception as mergeError:
+                loadResults[i]=mergeError
+    
+    for i,cfnLr in enumerate(zip(fileNames,loadResults)):
+        isRun=not isinstance(cfnLr[0],str)
+        currentFileName=" + ".join(cfnLr[0]) if(isRun) else cfnLr[0]
+        currentLoadResult=cfnLr[1]
         
-        firstLine=currentFile.readline()
-        currentFile.seek(0) #The current read position in the opened file is reset.
+        if(isinstance(currentLoadResult,Exception)): #The columns of a file that could not be loaded are left out. The key suffixes of the other files are unchanged.
+            print("The file "+currentFileName+" could not be loaded: "+str(currentLoadResult))
+            continue
         
-        currentFileReader=csv.reader(currentFile,delimiter=" ",skipinitialspace=True)
-        currentFileDataString=list(currentFileReader) #This list has string representations of the data.
-        rowCount=len(currentFileDataString)
-        columnCount=len(currentFileDataString[1])
-        currentFileDataFloat=[[float(currentFileDataString[i][j]) for i in range(1,rowCount)] for j in range(columnCount)] #Stores the data in a float format instead
-        #of a string format. Each sublist contains the values for a particular column. The first row is ignored because it contains the column names for the file.
-
-        currentColumnTitles=regex.findall("(?<=\[)([^\[]{1,})(?=\])",firstLine) #All substrings of the first line in the file with a length of at least 1 character between a [ and a ] and not containing a [ are found.    
-        for j in currentColumnTitles: #Loops through all found column titles (column numbers and their names).
-            columnNumber=regex.search("(?<=^)( *)([0-9]+)",j) #Gets a sequence of numbers following the start of the string and possibly some spaces.
-            columnName=regex.search("(?<=^)( *[0-9]+ *)(.+)",j) #Gets the substring following the start of the string, possibly some spaces, a number and possibly some spaces.
-            
-            columnKey=columnNumber.group(2)
-            columnDataIndex=int(columnKey)-1 #This number is shifted down by 1 because the column data list starts indices at zero while the numbers in the column titles start at 1.
-            columnKeySuffix=chr(ord("a")+i) #The key associated with the column information has a letter after the number that changes depending
-            columnKey+=columnKeySuffix #on what file the column belongs to. The letters start with a and advance through the Unicode characters.
-            
-            currentColumnData={"fileName":currentFileName,"columnName":columnName.group(2),"values":currentFileDataFloat[columnDataIndex]}           
-            columnData[columnKey]=currentColumnData #The key is associated with information about the column.
+        columnKeySuffix=chr(ord("a")+i) #The key associated with the column information has a letter after the number that changes depending
+        #on what file the column belongs to. The letters start with a and advance through the Unicode characters.
+        
+        currentColumnTitles=currentLoadResult[0]
+        columnKeys=[j[0]+columnKeySuffix for j in currentColumnTitles]
+        columnNames=[j[1] for j in currentColumnTitles]
+        columnDataIndices=[int(j[0])-1 for j in currentColumnTitles] #These numbers are shifted down by 1 because the rows of currentFileColumnValues start at zero while the numbers in the column titles start at 1.
+        fileIdentity=(getMergedEntryName(list(cfnLr[0])) if(isRun) else getCacheEntryName(currentFileName))+("-float32" if(valueType==numpy.float32) else "")
+        
+        if(prefetchFiles and (not isRun)):
+            prefetchedFile=prefetchedFiles[currentFileName]
+            loadColumns=functools.partial(prefetchedFile.loadColumns,valueType=valueType)
+            rowCount=prefetchedFile if(currentLoadResult[1] is None) else currentLoadResult[1]
+            columnData.addUnloadedFileColumns(currentFileName,columnKeys,columnNames,columnDataIndices,rowCount,loadColumns,fileIdentity)
+        elif(selectiveLoading and (not isRun)):
+            loadColumns=functools.partial(loadEvFileColumnsCached,currentFileName,valueType=valueType)
+            columnData.addUnloadedFileColumns(currentFileName,columnKeys,columnNames,columnDataIndices,currentLoadResult[1],loadColumns,fileIdentity)
+        else:
+            currentFileColumnValues=[j.astype(valueType,copy=False) for j in currentLoadResult[1]] #Each row of currentFileColumnValues contains the values for a particular column.
+            columnData.addFileColumns(currentFileName,columnKeys,columnNames,columnDataIndices,currentFileColumnValues,fileIdentity) #The columns are views of the rows of currentFileColumnValues.
+            if(len(currentLoadResult)>2): #Only the last file of a restarted run has rows appended to it.
+                columnData.fileDataEnds[cfnLr[0][-1] if(isRun) else currentFileName]=currentLoadResult[2]
 
     return columnData
     
@@ -122,10 +163,89 @@ def processAllowedUserInputs(allowedInputs):
             return currentInput
         else:
             print("That input is invalid. Try again.")
+
+
+#Asks the user for a list of inputs separated by commas; if any of the inputs are not in the allowed list the user is asked to try again.
+def processAllowedUserInputList(allowedInputs):
+    import regex
+    while(True):
+        currentInputs=[i[1] for i in regex.findall("(?<=(^|,))([^,]*)(?=($|,))",input())] #Splits the string up in order with commas as the separator.
         
+        if(all([i in allowedInputs for i in currentInputs])):
+            return currentInputs
+        else:
+            print("At least one of those inputs is invalid. Try again.")
+
+
+#Asks the user for the windows a polynomial is fitted over separately, as start:end pairs separated by commas. The windows are ranges of
+#row indices, or ranges of x values if the input starts with x. Returns the windows and whether they are ranges of x values, or None
+#and False if nothing is entered (the fit is over all of the values).
+def processFitWindowInput():
+    while(True):
+        currentInput=input().strip()
+        if(currentInput==""):
+            return None,False
+
+        windowsByX=currentInput.startswith("x")
+        try:
+            fitWindows=tuple([tuple([float(j) if(windowsByX) else int(j) for j in i.split(":")]) for i in currentInput.lstrip("x").split(",")])
+            if(all([len(i)==2 for i in fitWindows])):
+                getSortedWindows(fitWindows) #Checks that the windows do not overlap.
+                return fitWindows,windowsByX
+        except ValueError:
+            pass
+        print("Those windows are invalid. Try again.")
+        
+
+
+#Adds a user created column and returns its key. The recipe describes how the column was created (see derivedColumns), which allows
+#the column to be extended when the columns it was created from grow (see EvFileFollower) and to be found in the derived column cache.
+#If newColumnData is None the column is computed from its recipe when its values are first used.
+def addUserColumn(columnData,newColumnName,newColumnData,recipe=None,identity=None):
+    newColumnCount=0
+    for currentKey in columnData.keys():
+        if(currentKey[-1]=="_"): #If the current column has a key that ends with the _ character then it is a user made column.
+            newColumnCount+=1
+    
+    newColumn=ColumnRecord("User created columns",newColumnName,newColumnData,recipe,identity)
+    newColumnKey=str(newColumnCount+1)+"_" #Keys for user created columns use the "_" character as a suffix.
+    columnData[newColumnKey]=newColumn
+    return newColumnKey
+
+
+#Gets the key of the x column (the first column of the file) used to interpolate a column from a file onto a grid (see columnAlignment),
+#or None for user created columns, which do not have a file.
+def getDefaultXKey(columnData,columnKey):
+    if(columnKey[-1]=="_"):
+        return None
+    
+    columnFileName=columnData[columnKey]["fileName"]
+    return next(i for i,j in columnData.items() if(j["fileName"]==columnFileName))
+
+
+#Computes user created columns from their recipes, reusing previously computed columns where possible. Returns a list holding the
+#values, extra information and identity of each column, or None for columns whose input columns have different lengths.
+def getDerivedColumns(columnData,recipes):
+    derivedColumns=derivedColumnCache.getDerivedColumns(columnData,recipes)
+    for currentRecipe,currentDerivedColumn in zip(recipes,derivedColumns):
+        if(currentDerivedColumn is None): #A new column will not be added if the lists chosen for integration, differentiation or fitting have different lengths.
+            print("Lengths of lists do not match for column "+currentRecipe[2]+".")
+            
+    return derivedColumns
+
+
+#Checks that the columns used by a recipe for integration, differentiation or fitting have the same length, so the column can be added
+#before it is computed.
+def checkRecipeLengths(columnData,recipe):
+    if((recipe[0] in ["i","d","p","w"]) and (columnData.getColumnLength(recipe[1])!=columnData.getColumnLength(recipe[2]))):
+        print("Lengths of lists do not match for column "+recipe[2]+".")
+        return False
+    
+    return True
 
         
 def getColumnPairsToPlot(columnData):
+    import regex
     curvesToPlot=[] #Holds a list of tuples containing the keys of the x and y column pairs to be plotted along with the desired legend name.      
         
     
@@ -139,33 +259,35 @@ def getColumnPairsToPlot(columnData):
         allowedSelections.append("i") #The entry for integration.
         allowedSelections.append("d") #The entry for differentiation.
         allowedSelections.append("p") #The entry for a polynomial fit.
+        allowedSelections.append("w") #The entry for a window of a column.
     
         print("List of columns that can be plotted:")
         previousFileName=""    
         for currentKey,currentColumnData in columnData.items(): #Loops through all columns.
             currentFileName=currentColumnData["fileName"]
             currentColumnName=currentColumnData["columnName"]
-            currentColumnLength=str(len(currentColumnData["values"]))
+            #User created columns are not computed just to be listed, and files being parsed in the background are not waited for.
+            currentColumnLength=(str(columnData.getColumnLength(currentKey))+" values") if(columnData.isColumnReady(currentKey)) else "still being read"
             
             if(currentFileName!=previousFileName): #The file name is displayed if the current column is associated with a different file than the previous column.
                 print(" "+currentFileName)
                 previousFileName=currentFileName
                 
-            print("  "+currentKey+", "+currentColumnName+", ("+currentColumnLength+" values)")
+            print("  "+currentKey+", "+currentColumnName+", ("+currentColumnLength+")")
        
         
-        def addNewColumn(newColumnData):
-            newColumnCount=0
-            for currentKey in columnData.keys():
-                if(currentKey[-1]=="_"): #If the current column has a key that ends with the _ character then it is a user made column.
-                    newColumnCount+=1
-            
+        def addNewColumn(newColumnData,recipe=None,identity=None):
             print("Enter a name for the new column")
             newColumnName=input()
+            return addUserColumn(columnData,newColumnName,newColumnData,recipe,identity)
             
-            newColumn={"fileName":"User created columns","columnName":newColumnName,"values":newColumnData}
-            newColumnKey=str(newColumnCount+1)+"_" #Keys for user created columns use the "_" character as a suffix.
-            columnData[newColumnKey]=newColumn
+        #Adds columns made from recipes, asking for the name of each one. The columns are only computed once they are plotted.
+        def addNewDerivedColumns(recipes,columnDescription):
+            for currentRecipe in recipes:
+                if(checkRecipeLengths(columnData,currentRecipe)):
+                    if(len(recipes)>1):
+                        print(columnDescription+" of column "+currentRecipe[2]+":")
+                    addNewColumn(None,currentRecipe)
             
             
         def createLinearColumn():
@@ -176,40 +298,58 @@ def getColumnPairsToPlot(columnData):
             print("Enter ending element")
             endingElement=float(input())
             
-            differenceBetweenElements=(endingElement-startingElement)/(float(elementCount)-1.0)
-            newColumnValues=[startingElement+(float(i)*differenceBetweenElements) for i in range(0,elementCount)]
-            addNewColumn(newColumnValues)
+            addNewDerivedColumns([("l",elementCount,startingElement,endingElement)],"")
                         
         
         def createColumnFromEquation():
             expressionList,expressionVariables=getValidRpnExpression(allowedColumnKeys)
-            newColumnData=getDataForRpnExpression(columnData,expressionList,expressionVariables)
-            addNewColumn(newColumnData)
+            variableKeys=list(dict.fromkeys([i[0] for i in expressionVariables]))
+            if(len(set([columnData[i]["fileName"] for i in variableKeys]))==1):
+                addNewDerivedColumns([("e",list(expressionList),expressionVariables)],"")
+                return
+            
+            #Columns from different files can have different x values (such as times) in the same row, so they can be interpolated onto common x values.
+            print("The expression uses columns from more than one file. Enter r to combine their rows by index, u to interpolate them onto all of the x values of their files, o to interpolate them onto the x values where their files overlap, or a column key to interpolate them onto the values of that column")
+            alignmentChoice=processAllowedUserInputs(["r","u","o"]+allowedColumnKeys)
+            if(alignmentChoice=="r"):
+                addNewDerivedColumns([("e",list(expressionList),expressionVariables)],"")
+                return
+            
+            xKeys=[]
+            for currentKey in variableKeys: #Columns from files use the first column of their file as their x values.
+                xKey=getDefaultXKey(columnData,currentKey)
+                if(xKey is None):
+                    print("Enter the column key of the x values of column "+currentKey)
+                    xKey=processAllowedUserInputs(allowedColumnKeys)
+                xKeys.append((currentKey,xKey))
+            
+            gridKey=alignmentChoice
+            if(alignmentChoice in ["u","o"]):
+                print("The x values the columns are interpolated onto are added as a column.")
+                gridKey=addNewColumn(None,("g",alignmentModes[["u","o"].index(alignmentChoice)])+tuple(dict.fromkeys([i[1] for i in xKeys])))
+            print("The expression:")
+            addNewColumn(None,("e",list(expressionList),expressionVariables,gridKey,tuple(xKeys)))
             
         def createColumnFromIntegration():
-            print("Enter column key to be integrated")
-            yKey=processAllowedUserInputs(allowedColumnKeys)
+            print("Enter column key to be integrated, or several column keys separated by commas")
+            yKeys=processAllowedUserInputList(allowedColumnKeys)
             print("Enter column key to integrate over")
             xKey=processAllowedUserInputs(allowedColumnKeys)
             print("Enter constant of integration")
             constantOfIntegration=float(input())
             
-            integralValues=integrateValues(columnData[xKey]["values"],columnData[yKey]["values"],constantOfIntegration)
-            if(integralValues is not None): #A new column will not be added if the lists chosen for integration have different lengths.
-                addNewColumn(integralValues)
+            addNewDerivedColumns([("i",xKey,i,constantOfIntegration) for i in yKeys],"Integral") #All of the columns are integrated at once.
                         
             
         def createColumnFromDifferentiation():
-            print("Enter column key to be differentiated")
-            yKey=processAllowedUserInputs(allowedColumnKeys)
+            print("Enter column key to be differentiated, or several column keys separated by commas")
+            yKeys=processAllowedUserInputList(allowedColumnKeys)
             print("Enter column key to differentiate by")
             xKey=processAllowedUserInputs(allowedColumnKeys)            
             print("Enter distance from central point to calculate finite difference on")
             differentiationRadius=int(input())
             
-            derivativeValues=differentiateValues(columnData[xKey]["values"],columnData[yKey]["values"],differentiationRadius)
-            if(derivativeValues is not None): #A new column will not be added if the lists chosen for differentiation have different lengths.
-                addNewColumn(derivativeValues)
+            addNewDerivedColumns([("d",xKey,i,differentiationRadius) for i in yKeys],"Derivative") #All of the columns are differentiated at once.
                 
         
         #Creates a column from a polynomial fitted to two sets of columns.
@@ -220,19 +360,34 @@ def getColumnPairsToPlot(columnData):
             yKey=processAllowedUserInputs(allowedColumnKeys)
             print("Enter fit order")
             fitOrder=int(input())
+            print("Enter the windows to fit separately as start:end row indices separated by commas, starting with x for ranges of x values (such as x0.5:2,2:3.5), or nothing to fit all of the values")
+            fitWindows,windowsByX=processFitWindowInput()
+            
+            fitRecipe=("p",xKey,yKey,fitOrder) if(fitWindows is None) else ("p",xKey,yKey,fitOrder,fitWindows,windowsByX) #The fit is computed straight away so its coefficients can be shown.
+            fittedColumn=getDerivedColumns(columnData,[fitRecipe])[0]
+            if(fittedColumn is not None): #If the x and y data point sets have the same length.
+                print("Polynomial fit coefficients in order from the lowest to heighest are: "+str(numpy.array(fittedColumn[1]["coefficients"])))
+                addNewColumn(fittedColumn[0],fitRecipe,fittedColumn[2])
+                
+        
+        #Creates columns holding the rows of other columns where a column (usually the time) is within a range, without copying them.
+        def createColumnFromWindow():
+            print("Enter column key to take the window of, or several column keys separated by commas")
+            yKeys=processAllowedUserInputList(allowedColumnKeys)
+            print("Enter column key whose values the window is chosen by")
+            xKey=processAllowedUserInputs(allowedColumnKeys)
+            print("Enter lowest value of the window")
+            windowMinimum=float(input())
+            print("Enter highest value of the window")
+            windowMaximum=float(input())
             
-            xData=columnData[xKey]["values"]
-            yData=columnData[yKey]["values"]
-            if(len(xData)==len(yData)): #If the x and y data point sets have the same length.
-                fitCoefficients=polyfit(xData,yData,fitOrder,full=False)
-                fittedValues=polyval(xData,fitCoefficients)
-                print("Polynomial fit coefficients in order from the lowest to heighest are: "+str(fitCoefficients))
-                addNewColumn(fittedValues)
+            addNewDerivedColumns([("w",xKey,i,windowMinimum,windowMaximum) for i in yKeys],"Window")
                 
                                          
     
         while(True): #Loops while the user is selecting columns to plot.
             print("Select the x index, y index and desired legend name corresponding to what you want to plot, separated by commas. Enter f in you are finished with selecting columns to plot.")
+            print("The lowest and highest x values (in the units of the x column) to plot can be added after the legend name, separated by commas.")
             print("")
             print("Other options are:")
             print("l for a linearly spaced column created between two values.")
@@ -240,6 +395,7 @@ def getColumnPairsToPlot(columnData):
             print("i for a column that is the integral of a column with respect to another column.")
             print("d for a column that is the derivative of a column with respect to another column.")
             print("p for column created from a polynomial fit of two other columns.")
+            print("w for a column holding the rows of a column where another column is between two values.")
                         
             columnChoiceString=input()
             columnChoiceList=regex.findall("(?<=(^|,))([^,]*)(?=($|,))",columnChoiceString) #Splits the string up in order with commas as the separator.
@@ -272,10 +428,14 @@ def getColumnPairsToPlot(columnData):
                 createColumnFromPolynomialFit()
                 break
             
+            if(xIndexSelection=="w"):
+                createColumnFromWindow()
+                break
+            
 
 
-            if(len(columnChoiceList)!=3):
-                print("There needs to be three comma separated strings in the user input or a single valid option choice.")
+            if(len(columnChoiceList) not in [3,5]):
+                print("There needs to be three (or five with an x range) comma separated strings in the user input or a single valid option choice.")
                 continue
 
             yIndexSelection=columnChoiceList[1][1]
@@ -284,8 +444,16 @@ def getColumnPairsToPlot(columnData):
                 continue
                      
             desiredLegendName=columnChoiceList[2][1]
-                               
-            curvesToPlot.append((xIndexSelection,yIndexSelection,desiredLegendName))
+            
+            if(len(columnChoiceList)==5): #Only the rows with x values in the range are plotted.
+                try:
+                    xRange=(float(columnChoiceList[3][1]),float(columnChoiceList[4][1]))
+                except ValueError:
+                    print("An invalid x range was given.")
+                    continue
+                curvesToPlot.append((xIndexSelection,yIndexSelection,desiredLegendName)+xRange)
+            else:
+                curvesToPlot.append((xIndexSelection,yIndexSelection,desiredLegendName))
 
 
 #Creates a dictionary to hold information about the units used. A number key is associated with a tuple containing the
@@ -375,12 +543,31 @@ def getPlotUnits(unitDictionary):
     return unitDictionary[xUnitIndex],unitDictionary[yUnitIndex]
         
 
-#Plots all of the user selected x and y plots on top of one another.
-def plotColumnPairs(columnData,curvesToPlot,xUnits,yUnits):
+#Gets the scaled x and y values of a curve (see ColumnStore.getScaledValues). Curves can also hold the lowest and highest x values to plot
+#after their legend name, in which case the values are views of the rows in that range (see ColumnStore.getWindowRows).
+def getCurveValues(columnData,curveToPlot,xScaleFactor,yScaleFactor):
+    xDataScaled=columnData.getScaledValues(curveToPlot[0],xScaleFactor)
+    yDataScaled=columnData.getScaledValues(curveToPlot[1],yScaleFactor)
+    if(len(curveToPlot)>3):
+        startRow,endRow=columnData.getWindowRows(curveToPlot[0],curveToPlot[3],curveToPlot[4])
+        return xDataScaled[startRow:endRow],yDataScaled[startRow:endRow]
+
+    return xDataScaled,yDataScaled
+
+
+#Plots all of the user selected x and y plots on top of one another. If levelOfDetail is True each curve is drawn decimated to
+#the width of the axes in pixels, and is decimated again from the full data when the view changes (see DecimatedLine). If
+#curveCollection is True (or if it is None and there are at least PHANTOM_EV_COLLECTION_CURVES curves) the curves are drawn as a single
+#collection keyed by a colour bar instead of a legend (see curveCollection).
+@profileStage("line creation")
+def plotColumnPairs(columnData,curvesToPlot,xUnits,yUnits,levelOfDetail=False,curveCollection=None):
     if(len(curvesToPlot)==0):
         return None
     
+    import matplotlib.pyplot as plt
+    levelOfDetail=levelOfDetail or outOfCore.outOfCoreEnabled #Curves memory mapped from the disk are never drawn in full, as matplotlib would copy them into memory.
     plotFigure=plt.figure()
+    profileCanvasDrawing(plotFigure)
     plotAxes=plotFigure.gca()
     
     #The unit conversion factors from phantom units.
@@ -395,49 +582,144 @@ def plotColumnPairs(columnData,curvesToPlot,xUnits,yUnits):
     
     plotAxes.ticklabel_format(style="sci",scilimits=(0,0),useMathText=True)
     plotAxes.grid(visible=False)
+    plotFigure.decimatedLines=[] #Kept with the figure as the axes only hold weak references to the decimation callbacks.
+    plotFigure.curveLines=[] #The line of each curve, which is a CollectionCurve if the curves are drawn as a collection.
+    plotFigure.lineCollection=None
+    plotFigure.curveColorbar=None
+    if(curveCollection or ((curveCollection is None) and (len(curvesToPlot)>=collectionCurveCount))):
+        plotFigure.lineCollection,plotFigure.curveLines=createCurveCollection(plotAxes,len(curvesToPlot))
+    
+    #User created columns that have not been computed yet are computed together, so integrals and derivatives can share their work.
+    columnData.materializeColumns([i[0] for i in curvesToPlot]+[i[1] for i in curvesToPlot])
     
 
     for currentOrder,currentCurveToPlot in enumerate(curvesToPlot):
-        currentXColumnKey=currentCurveToPlot[0]
-        currentYColumnKey=currentCurveToPlot[1]
         currentLegendName=currentCurveToPlot[2]
         
-        xData=columnData[currentXColumnKey]["values"]
-        yData=columnData[currentYColumnKey]["values"]
-        
-        #New lists scaled for the correct units are created for the x and y axes; if done in place
-        #it would cause problems with shared columns between plots.
-        xDataScaled=[i*xScaleFactor for i in xData]
-        yDataScaled=[i*yScaleFactor for i in yData]
+        #The values scaled for the correct units are shared between all curves using the same column and unit, and are not copies
+        #if no scaling is needed. They are not scaled in place as that would cause problems with shared columns between plots.
+        xDataScaled,yDataScaled=getCurveValues(columnData,currentCurveToPlot,xScaleFactor,yScaleFactor)
             
-        plotAxes.plot(xDataScaled,yDataScaled,label=currentLegendName,zorder=(-1)-currentOrder)
-
+        if(plotFigure.lineCollection is not None): #The curve has the order of its path in the collection instead of a zorder.
+            currentLine=plotFigure.curveLines[currentOrder]
+        elif(levelOfDetail):
+            currentLine,=plotAxes.plot([],[],label=currentLegendName,zorder=(-1)-currentOrder)
+            plotFigure.curveLines.append(currentLine)
+        else:
+            currentLine,=plotAxes.plot(xDataScaled,yDataScaled,label=currentLegendName,zorder=(-1)-currentOrder)
+            plotFigure.curveLines.append(currentLine)
+            
+        if(levelOfDetail):
+            plotFigure.decimatedLines.append(DecimatedLine(currentLine,xDataScaled,yDataScaled))
+        elif(plotFigure.lineCollection is not None): #Paths need x and y values of the same length.
+            commonRowCount=min(len(xDataScaled),len(yDataScaled))
+            currentLine.set_data(xDataScaled[0:commonRowCount],yDataScaled[0:commonRowCount])
+            
+    #Scaled values for columns and units not used by this plot are no longer kept.
+    columnData.retainScaledValues(set([(i[0],xScaleFactor) for i in curvesToPlot]+[(i[1],yScaleFactor) for i in curvesToPlot]))
+    
+    if(plotFigure.lineCollection is not None):
+        plotFigure.curveColorbar=addCurveCollection(plotFigure,plotAxes,plotFigure.lineCollection,[i[2] for i in curvesToPlot])
+    else:
+        if(levelOfDetail): #The data limits are not updated when the data of the decimated lines is set.
+            plotAxes.relim()
+            plotAxes.autoscale_view()
      
-    legend=plotAxes.legend(loc="best")
-    legend.set_draggable(True)
+        legend=plotAxes.legend(loc="best")
+        legend.set_draggable(True)
     plotFigure.tight_layout()
     
     return plotFigure
 
 
+#Replaces the data of the curves drawn by plotColumnPairs with the current values of their columns, such as after the columns have been
+#extended by an EvFileFollower. The figure is not rebuilt.
+@profileStage("curve updates")
+def updateColumnPairs(plotFigure,columnData,curvesToPlot,xUnits,yUnits):
+    plotAxes=plotFigure.gca()
+    
+    for i,currentCurveToPlot in enumerate(curvesToPlot):
+        xDataScaled,yDataScaled=getCurveValues(columnData,currentCurveToPlot,xUnits[2],yUnits[2])
+        commonRowCount=min(len(xDataScaled),len(yDataScaled))
+        xDataScaled=xDataScaled[0:commonRowCount]
+        yDataScaled=yDataScaled[0:commonRowCount]
+        
+        if(len(plotFigure.decimatedLines)!=0):
+            plotFigure.decimatedLines[i].setData(xDataScaled,yDataScaled)
+        else:
+            plotFigure.curveLines[i].set_data(xDataScaled,yDataScaled)
+        
+    if(plotFigure.lineCollection is not None):
+        updateCollectionLimits(plotAxes,plotFigure.lineCollection)
+    else:
+        plotAxes.relim()
+        plotAxes.autoscale_view()
+    plotFigure.canvas.draw_idle()
+
+
+
+#Chooses the Qt5Agg backend so plots are shown in a window, unless a backend has been chosen with the MPLBACKEND environment variable. The
+#backend is only chosen when the first plot is made, so the functions in this file can be used without a display (see batchPlotter) and
+#files can be opened and columns created on computers without Qt.
+def selectPlotBackend():
+    import matplotlib.pyplot as plt
+    if("MPLBACKEND" in os.environ):
+        return
+    
+    previousBackend=plt.get_backend()
+    try:
+        plt.switch_backend("Qt5Agg")
+    except (ImportError,RuntimeError,ValueError) as backendError: #Qt may be missing, unable to start (such as without a display) or not a valid backend.
+        print("The Qt5Agg backend could not be used ("+str(backendError)+"). The "+previousBackend+" backend is used instead, which may not be able to show plots.")
+        plt.switch_backend(previousBackend)
+    
+
 
 def main():
     fileNames,openedFiles=openFiles()
-
-    columnData=getColumnData(fileNames,openedFiles)
+    
+    followInterval=getSetting("FOLLOW_INTERVAL",0) #The time in milliseconds between checks for new rows in the opened files, with 0 disabling the checks.
+    if(outOfCore.outOfCoreEnabled and (followInterval>0)): #Followed files are held in memory so new rows can be added to them.
+        print("Files cannot be followed in out of core mode, so new rows will not be shown.")
+        followInterval=0
+    selectiveLoading=getSetting("SELECTIVE_LOADING",False) and (followInterval<=0) #Followed files need all of their columns to be loaded.
+    prefetchFiles=getSetting("PREFETCH",True) and (followInterval<=0) #The files are parsed while the prompts are answered.
+    columnData=getColumnData(fileNames,openedFiles,selectiveLoading,getSetting("FLOAT32",False),prefetchFiles,followInterval>0)
+    
+    fileFollower=EvFileFollower(fileNames,columnData) if(followInterval>0) else None
 
     while(True):
+        if(fileFollower is not None): #Rows appended since the last plot are read so the column lengths shown are up to date.
+            fileFollower.poll()
+            
         unitDictionary=createUnitDictionary()
-        curvesToPlot=getColumnPairsToPlot(columnData)
+        try:
+            curvesToPlot=getColumnPairsToPlot(columnData)
+            columnData.materializeColumns([j for i in curvesToPlot for j in i[0:2]]) #Files still being parsed are waited for before the plot is made.
+        except FileLoadError as loadError: #The columns of a file that could not be loaded are left out and the columns are chosen again.
+            print(str(loadError))
+            continue
         
         if(len(curvesToPlot)==0):
             print("There is nothing to plot.")
         else:
             xUnits,yUnits=getPlotUnits(unitDictionary)
             
-            plotFigure=plotColumnPairs(columnData,curvesToPlot,xUnits,yUnits)
-            controlVariables={"fontSize":matplotlib.rcParams["font.size"],"legendColumnCount":1,"legendVisible":True,"legendSplit":False,"xAxisUseScientificNotation":True,"yAxisUseScientificNotation":True,"xAxisTextVisible":True,"yAxisTextVisible":True,"rasterization":False}
+            selectPlotBackend()
+            import matplotlib.pyplot as plt
+            from controls import createControls,createControlVariables
+            plotFigure=plotColumnPairs(columnData,curvesToPlot,xUnits,yUnits,levelOfDetail=getSetting("LEVEL_OF_DETAIL",False))
+            controlVariables=createControlVariables()
             createdControlObjects=createControls(plotFigure,controlVariables,xUnits,yUnits)
+            
+            if(fileFollower is not None): #The plot is updated while it is shown when rows are appended to the files.
+                def updateFollowedPlot():
+                    if(fileFollower.poll()):
+                        updateColumnPairs(plotFigure,columnData,curvesToPlot,xUnits,yUnits)
+                        
+                followTimer=plotFigure.canvas.new_timer(interval=followInterval)
+                followTimer.add_callback(updateFollowedPlot)
+                followTimer.start()
   
             plt.show(block=True)
             
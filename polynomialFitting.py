@@ -0,0 +1,139 @@
+import numpy
+
+import outOfCore
+
+
+#Polynomials are fitted by least squares a chunk of rows at a time, adding each chunk's sums of powers of x and of powers of x times y to
+#the normal equations, so the memory used does not depend on the length of the columns. A fit can be made over separate windows of the
+#columns, given either as ranges of row indices (start inclusive, end exclusive) or as ranges of x values (both ends inclusive), with
+#every window fitted in the same pass. The x values of each window are mapped onto -1 to 1 before their powers are taken so the normal
+#equations stay well conditioned for higher orders. Windows must not overlap.
+
+
+#Gets the windows sorted by their start along with the windows' order in the input. Raises a ValueError if windows overlap or are empty.
+def getSortedWindows(fitWindows):
+    windowOrder=sorted(range(0,len(fitWindows)),key=lambda i:fitWindows[i][0])
+    windowStarts=numpy.array([fitWindows[i][0] for i in windowOrder],dtype=numpy.float64)
+    windowEnds=numpy.array([fitWindows[i][1] for i in windowOrder],dtype=numpy.float64)
+
+    if(numpy.any(windowEnds<windowStarts) or numpy.any(windowStarts[1:]<windowEnds[0:-1])):
+        raise ValueError("The fit windows "+str(list(fitWindows))+" overlap or end before they start.")
+    return windowOrder,windowStarts,windowEnds
+
+
+#Gets the sorted window that each value is in, or -1 for values outside every window. Values are row indices for index windows and
+#x values for x windows.
+def getWindowIndices(windowValues,windowStarts,windowEnds,windowsByX):
+    windowIndices=numpy.searchsorted(windowStarts,windowValues,side="right")-1
+    validIndices=numpy.maximum(windowIndices,0)
+    with numpy.errstate(invalid="ignore"):
+        outsideWindows=(windowIndices<0)|((windowValues>windowEnds[validIndices]) if(windowsByX) else (windowValues>=windowEnds[validIndices]))
+    windowIndices[outsideWindows]=-1
+    return windowIndices
+
+
+#Gets the values used to choose the window of each row of a chunk.
+def getChunkWindowValues(xChunk,chunkStart,windowsByX):
+    return xChunk if(windowsByX) else numpy.arange(chunkStart,chunkStart+len(xChunk),dtype=numpy.float64)
+
+
+#Gets the centre and half width of the x values of each sorted window. For x windows these come from the window bounds, while for index
+#windows the smallest and largest x values of each window are found with reduceat, as the rows of a window are contiguous.
+def getWindowScaling(xValues,windowStarts,windowEnds,windowsByX):
+    if(windowsByX):
+        windowMinimums,windowMaximums=windowStarts.copy(),windowEnds.copy()
+    else:
+        windowMinimums=numpy.full(len(windowStarts),numpy.inf)
+        windowMaximums=numpy.full(len(windowStarts),-numpy.inf)
+        for chunkStart,chunkEnd in outOfCore.getChunkRanges(len(xValues)):
+            chunkWindows=numpy.flatnonzero((windowStarts<chunkEnd)&(windowEnds>chunkStart)&(windowEnds>windowStarts))
+            if(len(chunkWindows)==0):
+                continue
+
+            #The rows of the chunk are split at the start and end of each window inside it. Segments between windows are not used.
+            #A value is added to the end of the chunk so a window can end at the end of the chunk.
+            segmentBounds=numpy.stack((numpy.clip(windowStarts[chunkWindows],chunkStart,chunkEnd),numpy.clip(windowEnds[chunkWindows],chunkStart,chunkEnd)),axis=1).ravel().astype(numpy.int64)-chunkStart
+            xChunk=numpy.append(numpy.asarray(xValues[chunkStart:chunkEnd],dtype=numpy.float64),0.0)
+            windowMinimums[chunkWindows]=numpy.minimum(windowMinimums[chunkWindows],numpy.minimum.reduceat(xChunk,segmentBounds)[0::2])
+            windowMaximums[chunkWindows]=numpy.maximum(windowMaximums[chunkWindows],numpy.maximum.reduceat(xChunk,segmentBounds)[0::2])
+
+    windowCentres=0.5*(windowMinimums+windowMaximums)
+    windowHalfWidths=0.5*(windowMaximums-windowMinimums)
+    windowHalfWidths[~(windowHalfWidths>0.0)]=1.0 #Windows with a single x value (or none) are not scaled.
+    windowCentres[~numpy.isfinite(windowCentres)]=0.0
+    return windowCentres,windowHalfWidths
+
+
+#Fits a polynomial of order fitOrder over each window of two columns, or over all of the rows if fitWindows is None. Returns a fit, which
+#holds the windows along with the coefficients of the polynomial of each window in terms of its scaled x values (see
+#evaluatePolynomialFit), and the coefficients of each window in terms of x, from the lowest to highest power.
+def fitPolynomialWindows(xValues,yValues,fitOrder,fitWindows=None,windowsByX=False):
+    rowCount=len(xValues)
+    if(fitWindows is None):
+        fitWindows=[(0,rowCount)]
+        windowsByX=False
+
+    windowOrder,windowStarts,windowEnds=getSortedWindows(fitWindows)
+    windowCentres,windowHalfWidths=getWindowScaling(xValues,windowStarts,windowEnds,windowsByX)
+    windowCount=len(windowStarts)
+
+    powerSums=numpy.zeros((windowCount,2*fitOrder+1)) #The sums of the scaled x values to each power from 0 to 2*fitOrder.
+    productSums=numpy.zeros((windowCount,fitOrder+1)) #The sums of the y values times the scaled x values to each power from 0 to fitOrder.
+    for chunkStart,chunkEnd in outOfCore.getChunkRanges(rowCount):
+        xChunk=numpy.asarray(xValues[chunkStart:chunkEnd],dtype=numpy.float64)
+        yChunk=numpy.asarray(yValues[chunkStart:chunkEnd],dtype=numpy.float64)
+        windowIndices=getWindowIndices(getChunkWindowValues(xChunk,chunkStart,windowsByX),windowStarts,windowEnds,windowsByX)
+        insideWindows=windowIndices>=0
+        if(not insideWindows.any()):
+            continue
+
+        windowIndices=windowIndices[insideWindows]
+        scaledX=(xChunk[insideWindows]-windowCentres[windowIndices])/windowHalfWidths[windowIndices]
+        yChunk=yChunk[insideWindows]
+        currentPowers=numpy.ones(len(scaledX))
+        for i in range(0,2*fitOrder+1): #The sums of every window are added at once by bincount.
+            powerSums[:,i]+=numpy.bincount(windowIndices,weights=currentPowers,minlength=windowCount)
+            if(i<=fitOrder):
+                productSums[:,i]+=numpy.bincount(windowIndices,weights=currentPowers*yChunk,minlength=windowCount)
+            currentPowers=currentPowers*scaledX
+
+    #The normal equations of every window are solved at once. The pseudoinverse gives the smallest coefficients that fit windows with
+    #fewer points than coefficients.
+    powerIndices=numpy.arange(0,fitOrder+1)
+    normalMatrices=powerSums[:,powerIndices[:,None]+powerIndices[None,:]]
+    scaledCoefficients=numpy.matmul(numpy.linalg.pinv(normalMatrices),productSums[:,:,None])[:,:,0]
+
+    from numpy.polynomial import Polynomial #Only imported when a fit is first made, so the program starts faster.
+    fitCoefficients=[None]*windowCount
+    for i,j in enumerate(windowOrder):
+        scaledPolynomial=Polynomial(scaledCoefficients[i],domain=[windowCentres[i]-windowHalfWidths[i],windowCentres[i]+windowHalfWidths[i]])
+        fitCoefficients[j]=[float(k) for k in scaledPolynomial.convert().coef]+[0.0]*fitOrder #convert removes trailing zero coefficients.
+        fitCoefficients[j]=fitCoefficients[j][0:fitOrder+1]
+
+    polynomialFit={"windowStarts":windowStarts,"windowEnds":windowEnds,"windowsByX":windowsByX,"windowCentres":windowCentres,
+                   "windowHalfWidths":windowHalfWidths,"scaledCoefficients":scaledCoefficients}
+    return polynomialFit,fitCoefficients
+
+
+#Evaluates a fit at each x value, using the polynomial of the window each row is in. Rows outside every window are NaN. Every window is
+#evaluated at once a chunk of rows at a time with Horner's method, so no copies of the windows are made. In out of core mode the values
+#are stored in a memory mapped column.
+def evaluatePolynomialFit(xValues,polynomialFit):
+    rowCount=len(xValues)
+    fittedValues=outOfCore.createTemporaryColumn(rowCount) if(outOfCore.outOfCoreEnabled) else numpy.empty(rowCount)
+    scaledCoefficients=polynomialFit["scaledCoefficients"]
+
+    for chunkStart,chunkEnd in outOfCore.getChunkRanges(rowCount):
+        xChunk=numpy.asarray(xValues[chunkStart:chunkEnd],dtype=numpy.float64)
+        windowIndices=getWindowIndices(getChunkWindowValues(xChunk,chunkStart,polynomialFit["windowsByX"]),polynomialFit["windowStarts"],
+                                       polynomialFit["windowEnds"],polynomialFit["windowsByX"])
+        validIndices=numpy.maximum(windowIndices,0)
+        scaledX=(xChunk-polynomialFit["windowCentres"][validIndices])/polynomialFit["windowHalfWidths"][validIndices]
+
+        chunkValues=scaledCoefficients[validIndices,-1]
+        for i in range(scaledCoefficients.shape[1]-2,-1,-1):
+            chunkValues=chunkValues*scaledX+scaledCoefficients[validIndices,i]
+        chunkValues[windowIndices<0]=numpy.nan
+        fittedValues[chunkStart:chunkEnd]=chunkValues
+
+    return fittedValues
@@ -0,0 +1,103 @@
+import time
+import atexit
+import cProfile
+import functools
+import contextlib
+import tracemalloc
+
+from settings import getSetting
+
+
+profilingEnabled=getSetting("PROFILE",False) #If True the time taken, number of calls and memory allocated by each stage are printed at exit.
+profileDumpFileName=getSetting("PROFILE_DUMP","") #If not empty the cProfile statistics of the slowest stage are saved to this file at exit.
+peakResettable=hasattr(tracemalloc,"reset_peak") #Before Python 3.9 the peak cannot be reset, so the memory used by a stage is only measured when it starts and ends.
+
+
+stageStatistics={} #Associates the name of each stage with its number of calls, total time in seconds and the most memory allocated by one call in bytes.
+activeStages=[] #Holds the memory in use when each stage that is running started and the most memory used while it has been running.
+stageProfilers={} #Associates the names of stages with the cProfile profiles of their calls when they are not called from inside another stage.
+
+
+#Records the time taken and memory allocated by the code inside a with statement as a call of a stage. Stages can be inside other stages,
+#in which case the time and memory of the inner stage are also counted as part of the outer stage. Nothing is recorded if profiling is
+#not enabled.
+@contextlib.contextmanager
+def profiledStage(stageName):
+    if(not profilingEnabled):
+        yield
+        return
+
+    startingMemory,peakMemory=tracemalloc.get_traced_memory()
+    if(not peakResettable):
+        peakMemory=startingMemory
+    if(len(activeStages)>0): #The peak memory is reset for this stage, so the peak so far is kept for the stage it is inside.
+        activeStages[-1][1]=max(activeStages[-1][1],peakMemory)
+    if(peakResettable):
+        tracemalloc.reset_peak()
+    activeStages.append([startingMemory,startingMemory])
+
+    stageProfiler=None
+    if((profileDumpFileName!="") and (len(activeStages)==1)): #cProfile cannot profile stages inside other stages separately.
+        stageProfiler=stageProfilers.setdefault(stageName,cProfile.Profile())
+        stageProfiler.enable()
+
+    startTime=time.perf_counter()
+    try:
+        yield
+    finally:
+        stageTime=time.perf_counter()-startTime
+        if(stageProfiler is not None):
+            stageProfiler.disable()
+
+        startingMemory,stagePeakMemory=activeStages.pop()
+        stagePeakMemory=max(stagePeakMemory,tracemalloc.get_traced_memory()[1 if(peakResettable) else 0])
+        if(len(activeStages)>0):
+            activeStages[-1][1]=max(activeStages[-1][1],stagePeakMemory)
+
+        currentStatistics=stageStatistics.setdefault(stageName,[0,0.0,0])
+        currentStatistics[0]+=1
+        currentStatistics[1]+=stageTime
+        currentStatistics[2]=max(currentStatistics[2],stagePeakMemory-startingMemory)
+
+
+#Creates a decorator that records every call of a function as a call of a stage (see profiledStage). The function is returned unchanged
+#if profiling is not enabled, so there is no cost when profiling is not used.
+def profileStage(stageName):
+    def stageDecorator(stageFunction):
+        if(not profilingEnabled):
+            return stageFunction
+
+        @functools.wraps(stageFunction)
+        def profiledFunction(*arguments,**keywordArguments):
+            with profiledStage(stageName):
+                return stageFunction(*arguments,**keywordArguments)
+
+        return profiledFunction
+    return stageDecorator
+
+
+#Records the drawing of a figure as a stage each time its canvas is drawn.
+def profileCanvasDrawing(plotFigure,stageName="canvas drawing"):
+    if(profilingEnabled):
+        plotFigure.canvas.draw=profileStage(stageName)(plotFigure.canvas.draw)
+
+
+def printProfileSummary():
+    if(len(stageStatistics)==0):
+        return
+
+    print("")
+    print("{:36s} {:>8s} {:>12s} {:>12s} {:>12s}".format("Stage","Calls","Total (s)","Mean (ms)","Memory (MiB)"))
+    for currentStageName,currentStatistics in sorted(stageStatistics.items(),key=lambda i:i[1][1],reverse=True):
+        callCount,totalTime,peakMemory=currentStatistics
+        print("{:36s} {:8d} {:12.4f} {:12.3f} {:12.2f}".format(currentStageName,callCount,totalTime,1000.0*totalTime/callCount,peakMemory/float(1<<20)))
+
+    if(len(stageProfilers)!=0): #Only stages that were profiled with cProfile are considered.
+        slowestStageName=max(stageProfilers.keys(),key=lambda i:stageStatistics.get(i,[0,0.0])[1])
+        stageProfilers[slowestStageName].dump_stats(profileDumpFileName)
+        print("The cProfile statistics of the stage \""+slowestStageName+"\" were saved to "+profileDumpFileName+" (they can be read with the pstats module).")
+
+
+if(profilingEnabled):
+    tracemalloc.start()
+    atexit.register(printProfileSummary)
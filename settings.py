@@ -0,0 +1,14 @@
+import os
+
+
+#Settings that change how the program works are read from environment variables whose names start with PHANTOM_EV_, so they can be
+#changed without editing the program or answering extra prompts. The type of the default value determines how the variable is read.
+def getSetting(settingName,defaultValue):
+    settingString=os.environ.get("PHANTOM_EV_"+settingName)
+    
+    if(settingString is None):
+        return defaultValue
+    if(isinstance(defaultValue,bool)):
+        return settingString.lower() not in ["","0","false","no","off"]
+    
+    return type(defaultValue)(settingString)